@@ -0,0 +1,801 @@
+# Micro-benchmarks for the interpreter; run `python benchmarks.py [name ...]`
+import contextlib
+import math
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import os
+
+import brewbuiltins
+import brewenv
+import brewio
+import brewvalues
+import intbase
+from brewenv import Binding, Environment
+from brewparse import parse_program
+from element import ForNode, IfNode
+import interpreterv2
+from interpreterv2 import Interpreter
+
+
+def best_of(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_quiet(program, **run_options):
+    interpreter = Interpreter(console_output=False)
+    interpreter.run(program, **run_options)
+    return interpreter
+
+
+LOOP_PROGRAM = """
+func main() {
+  var i;
+  var total;
+  total = 0;
+  for (i = 0; i < 50000; i = i + 1) {
+    total = total + i * 2;
+    if (total > 1000000) {
+      total = total - 1000000;
+    }
+  }
+  print(total);
+}
+"""
+
+
+# runs ifs and for loops without charging steps or checking limits, as before metering
+class UnmeteredInterpreter(Interpreter):
+    def run_if(self, statement_node):
+        result = self.evaluate_expression(statement_node.condition)
+        if type(result) is not bool:
+            super().error(intbase.ErrorType.TYPE_ERROR,
+                          "Condition of the if statement does not evaluate to a boolean",
+                          node=statement_node)
+        if result:
+            return self.run_scoped_block(statement_node.statements)
+        elif statement_node.else_statements is not None:
+            return self.run_scoped_block(statement_node.else_statements)
+
+    def run_for(self, statement_node):
+        self.run_statement(statement_node.init)
+        while True:
+            result = self.evaluate_expression(statement_node.condition)
+            if type(result) is not bool:
+                super().error(intbase.ErrorType.TYPE_ERROR,
+                              "Terminating condition of the for statement does not evaluate to a boolean",
+                              node=statement_node)
+            if not result:
+                break
+            if self.run_scoped_block(statement_node.statements):
+                return True
+            self.run_statement(statement_node.update)
+
+
+UnmeteredInterpreter.statement_handlers = interpreterv2.HandlerTable(
+    {**Interpreter.statement_handlers, IfNode: UnmeteredInterpreter.run_if, ForNode: UnmeteredInterpreter.run_for},
+    Interpreter.statement_handlers.default,
+)
+
+
+def bench_metering():
+    unmetered = best_of(lambda: UnmeteredInterpreter(console_output=False).run(LOOP_PROGRAM), repeat=5)
+    unlimited = best_of(lambda: run_quiet(LOOP_PROGRAM), repeat=5)
+    limited = best_of(lambda: run_quiet(LOOP_PROGRAM, step_limit=10**9), repeat=5)
+    steps = run_quiet(LOOP_PROGRAM).steps
+    print(f"metering: {steps} steps, unmetered loop {unmetered:.3f}s, metered without a budget {unlimited:.3f}s, "
+          f"with budget {limited:.3f}s")
+
+
+KILOBYTE = "x" * 1024
+
+# appends 1 KB at a time until the string holds 10 MB
+STRING_BUILD_PROGRAM = f"""
+func main() {{
+  var s;
+  var i;
+  s = "";
+  for (i = 0; i < 10240; i = i + 1) {{
+    s = s + "{KILOBYTE}";
+  }}
+  print(s == "");
+}}
+"""
+
+
+def bench_string_build():
+    roped = best_of(lambda: run_quiet(STRING_BUILD_PROGRAM), repeat=1)
+    saved = brewvalues.ROPE_MIN_LENGTH
+    brewvalues.ROPE_MIN_LENGTH = math.inf
+    try:
+        flat = best_of(lambda: run_quiet(STRING_BUILD_PROGRAM), repeat=1)
+    finally:
+        brewvalues.ROPE_MIN_LENGTH = saved
+    print(f"string_build: 10 MB by 1 KB appends, rope {roped:.3f}s, flat str {flat:.3f}s")
+
+
+# bytes allocated by fill() as seen by tracemalloc
+def traced_bytes(fill):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fill()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def bench_environment_memory(count=10**5):
+    names = [f"v{i}" for i in range(count)]
+
+    # what the interpreter used to keep per variable: a name list plus value and type dicts
+    def parallel_containers():
+        variable_list, name_to_value, var_to_type = [], {}, {}
+        for name in names:
+            variable_list.append(name)
+            name_to_value[name] = 0
+            var_to_type[name] = "int"
+        return variable_list, name_to_value, var_to_type
+
+    def environment():
+        env = Environment()
+        for name in names:
+            env.define(name, 0, "int")
+        return env
+
+    old = traced_bytes(parallel_containers)
+    new = traced_bytes(environment)
+    print(f"environment_memory: {count} variables, parallel containers {old / 1e6:.2f} MB, "
+          f"Environment {new / 1e6:.2f} MB")
+
+
+FIB_PROGRAM = """
+func fib(n) {
+  if (n < 2) {
+    return n;
+  }
+  return fib(n - 1) + fib(n - 2);
+}
+func main() {
+  print(fib(%d));
+}
+"""
+
+
+# counts Environment and Binding constructions while fn runs
+def count_allocations(fn):
+    counts = {Environment: 0, Binding: 0}
+    originals = {cls: cls.__init__ for cls in counts}
+
+    def counting(cls):
+        original = originals[cls]
+
+        def init(self, *args):
+            counts[cls] += 1
+            original(self, *args)
+        return init
+
+    for cls in counts:
+        cls.__init__ = counting(cls)
+    try:
+        fn()
+    finally:
+        for cls, original in originals.items():
+            cls.__init__ = original
+    return counts[Environment], counts[Binding]
+
+
+def bench_calls(n=20):
+    program = FIB_PROGRAM % n
+    a, b = 0, 1
+    for _ in range(n + 1):
+        a, b = b, a + b
+    calls = 2 * a - 1  # fib(n) makes 2 * F(n + 1) - 1 calls
+    for label, limit in (("pooled", brewenv.FRAME_POOL_LIMIT), ("unpooled", 0)):
+        saved = brewenv.FRAME_POOL_LIMIT
+        brewenv.FRAME_POOL_LIMIT = limit
+        try:
+            elapsed = best_of(lambda: run_quiet(program))
+            frames, bindings = count_allocations(lambda: run_quiet(program))
+        finally:
+            brewenv.FRAME_POOL_LIMIT = saved
+        print(f"calls ({label}): fib({n}) {calls} calls, {calls / elapsed:,.0f} calls/s, "
+              f"{frames / calls:.4f} frames and {bindings / calls:.4f} bindings allocated per call")
+
+
+# roughly 1 MB of generated Brewin whose functions repeat the same statement blocks
+def generated_source(target_bytes=1 << 20):
+    template = """
+func step{0}(a, b) {{
+  var t;
+  t = a * 2 + b;
+  if (t > 100) {{
+    t = t - 100;
+    print("overflow in step", t);
+  }}
+  for (a = 0; a < b; a = a + 1) {{
+    t = t + a * 3 - 1;
+  }}
+  return t;
+}}
+"""
+    parts = []
+    size = 0
+    i = 0
+    while size < target_bytes:
+        part = template.format(i)
+        parts.append(part)
+        size += len(part)
+        i += 1
+    parts.append("func main() {\n  print(step0(1, 2));\n}\n")
+    return "".join(parts)
+
+
+def bench_hash_cons():
+    source = generated_source()
+    plain = traced_bytes(lambda: parse_program(source))
+    shared = traced_bytes(lambda: parse_program(source, hash_cons=True))
+    print(f"hash_cons: {len(source) / 1e6:.2f} MB source, plain AST {plain / 1e6:.2f} MB, "
+          f"hash-consed AST {shared / 1e6:.2f} MB")
+
+
+STRUCT_PROGRAM = """
+struct point { x: int; y: int; label: string; next: point; }
+func main() {
+  var i;
+  var p: point;
+  var total;
+  total = 0;
+  for (i = 0; i < 50000; i = i + 1) {
+    p = new point;
+    p.x = i;
+    p.y = p.x * 2;
+    total = total + p.y - p.x;
+  }
+  print(total);
+}
+"""
+
+
+def bench_structs(count=10**5):
+    elapsed = best_of(lambda: run_quiet(STRUCT_PROGRAM))
+    layout = brewvalues.StructLayout("point", ["x", "y", "label", "next"])
+    layout.template = [0, 0, "", brewvalues.NIL]
+    fixed = traced_bytes(lambda: [layout.instantiate() for _ in range(count)])
+    keyed = traced_bytes(lambda: [dict(x=0, y=0, label="", next=None) for _ in range(count)])
+    print(f"structs: 50000 new + 3 field loads + 2 field stores in {elapsed:.3f}s; "
+          f"{count} 4-field instances, fixed layout {fixed / 1e6:.2f} MB, per-instance dict {keyed / 1e6:.2f} MB")
+
+
+LINKED_LIST_PROGRAM = """
+struct node { value: int; next: node; }
+func main() {
+  var head: node;
+  var n: node;
+  var i;
+  var round;
+  var total;
+  for (i = 0; i < 1000; i = i + 1) {
+    n = new node;
+    n.value = i;
+    n.next = head;
+    head = n;
+  }
+  total = 0;
+  for (round = 0; round < 30; round = round + 1) {
+    for (n = head; n.next != nil; n = n.next) {
+      total = total + n.value - n.next.value;
+    }
+  }
+  print(total);
+}
+"""
+
+
+def bench_field_caches():
+    cached = best_of(lambda: run_quiet(LINKED_LIST_PROGRAM))
+    saved = interpreterv2.FIELD_CACHE_LIMIT
+    interpreterv2.FIELD_CACHE_LIMIT = 0
+    try:
+        uncached = best_of(lambda: run_quiet(LINKED_LIST_PROGRAM))
+    finally:
+        interpreterv2.FIELD_CACHE_LIMIT = saved
+    print(f"field_caches: 1000-node list walked 30 times via node.next.value, "
+          f"inline caches {cached:.3f}s, name lookups {uncached:.3f}s")
+
+
+EXCEPTION_PROGRAM = """
+func check(i) {
+  if (i - i / %(period)d * %(period)d == 0) {
+    raise "hit";
+  }
+  return i;
+}
+func work(i) {
+  return check(i) + 1;
+}
+func main() {
+  var i;
+  var total;
+  total = 0;
+  for (i = 1; i < 20000; i = i + 1) {
+    %(body)s
+  }
+  print(total);
+}
+"""
+
+GUARDED_BODY = 'try { total = total + work(i); } catch "miss" { total = total - 1; } catch "hit" { total = total + 1; }'
+
+
+def bench_exceptions():
+    bare = best_of(lambda: run_quiet(EXCEPTION_PROGRAM % {
+        "period": 100000, "body": "total = total + work(i);"}), repeat=7)
+    guarded = best_of(lambda: run_quiet(EXCEPTION_PROGRAM % {"period": 100000, "body": GUARDED_BODY}), repeat=7)
+    raising = best_of(lambda: run_quiet(EXCEPTION_PROGRAM % {"period": 1, "body": GUARDED_BODY}))
+    print(f"exceptions: 20000 iterations, no try {bare:.3f}s, try without raises {guarded:.3f}s, "
+          f"raise through 2 calls every iteration {raising:.3f}s")
+
+
+def bench_errors(count=10**5):
+    interpreter = Interpreter(console_output=False)
+    node = parse_program("func main() { print(x); }").functions[0].statements[0]
+    name = "x"
+
+    def raise_errors(make_error):
+        for _ in range(count):
+            try:
+                make_error()
+            except intbase.BrewinError:
+                pass
+
+    def raise_eager():
+        interpreter.error(intbase.ErrorType.NAME_ERROR, f"Variable {name} has not been defined", node=node)
+
+    def raise_deferred():
+        interpreter.error(intbase.ErrorType.NAME_ERROR, "Variable {} has not been defined", node=node, args=(name,))
+
+    eager = best_of(lambda: raise_errors(raise_eager), repeat=9)
+    deferred = best_of(lambda: raise_errors(raise_deferred), repeat=9)
+    print(f"errors: {count} errors raised and caught unread, f-string description "
+          f"{eager / count * 1e6:.2f}us each, template and args {deferred / count * 1e6:.2f}us each")
+
+
+def bench_catch_dispatch():
+    for handlers in (1, 200):
+        catchers = " ".join(f'catch "e{k}" {{ total = total + {k}; }}' for k in range(handlers))
+        program = EXCEPTION_PROGRAM.replace('"hit"', f'"e{handlers - 1}"') % {
+            "period": 1, "body": f"try {{ total = total + work(i); }} {catchers}"}
+        elapsed = best_of(lambda: run_quiet(program))
+        print(f"catch_dispatch: 20000 raises matched by the last of {handlers} catchers in {elapsed:.3f}s")
+
+
+MIN_PROGRAM = """
+func smaller(a, b) {
+  if (a < b) {
+    return a;
+  }
+  return b;
+}
+func main() {
+  var i;
+  var total;
+  total = 0;
+  for (i = 0; i < 30000; i = i + 1) {
+    total = total + %s(i, 15000);
+  }
+  print(total);
+}
+"""
+
+
+def bench_builtins():
+    native = best_of(lambda: run_quiet(MIN_PROGRAM % "min"))
+    brewin = best_of(lambda: run_quiet(MIN_PROGRAM % "smaller"))
+    print(f"builtins: 30000 two-argument minimums, native min() {native:.3f}s, Brewin function {brewin:.3f}s")
+
+
+ARRAY_PROGRAM = """
+func main() {
+  var values;
+  var i;
+  var round;
+  var total;
+  values = array(5000);
+  for (i = 0; i < 5000; i = i + 1) {
+    set(values, i, i);
+  }
+  total = 0;
+  for (round = 0; round < 10; round = round + 1) {
+    for (i = 0; i < 5000; i = i + 1) {
+      total = total + get(values, i);
+    }
+  }
+  print(total);
+}
+"""
+
+STRUCT_LIST_PROGRAM = """
+struct cell { value: int; next: cell; }
+func main() {
+  var head: cell;
+  var c: cell;
+  var i;
+  var round;
+  var total;
+  for (i = 0; i < 5000; i = i + 1) {
+    c = new cell;
+    c.value = 4999 - i;
+    c.next = head;
+    head = c;
+  }
+  total = 0;
+  for (round = 0; round < 10; round = round + 1) {
+    for (c = head; c != nil; c = c.next) {
+      total = total + c.value;
+    }
+  }
+  print(total);
+}
+"""
+
+
+def bench_int_array(count=10**5):
+    native = best_of(lambda: run_quiet(ARRAY_PROGRAM))
+    linked = best_of(lambda: run_quiet(STRUCT_LIST_PROGRAM))
+    layout = brewvalues.StructLayout("cell", ["value", "next"])
+    layout.template = [0, brewvalues.NIL]
+
+    def struct_list():
+        head = brewvalues.NIL
+        for i in range(count):
+            cell = layout.instantiate()
+            cell.fields[0] = i
+            cell.fields[1] = head
+            head = cell
+        return head
+
+    array_bytes = traced_bytes(lambda: brewvalues.new_int_array(count))
+    list_bytes = traced_bytes(struct_list)
+    print(f"int_array: 5000 ints built then summed 10 times, array builtins {native:.3f}s, "
+          f"struct list {linked:.3f}s; {count} ints take {array_bytes / 1e6:.2f} MB as an array, "
+          f"{list_bytes / 1e6:.2f} MB as a struct list")
+
+
+WORD_COUNT_MAP_PROGRAM = """
+func main() {
+  var counts;
+  var word;
+  var i;
+  counts = map();
+  for (i = 0; i < %d; i = i + 1) {
+    word = inputs();
+    if (has(counts, word)) {
+      put(counts, word, get(counts, word) + 1);
+    } else {
+      put(counts, word, 1);
+    }
+  }
+  print(size(counts), " ", get(counts, "w7"));
+}
+"""
+
+WORD_COUNT_LIST_PROGRAM = """
+struct entry { word: string; count: int; next: entry; }
+func main() {
+  var head: entry;
+  var e: entry;
+  var word;
+  var i;
+  var distinct;
+  var found;
+  distinct = 0;
+  for (i = 0; i < %d; i = i + 1) {
+    word = inputs();
+    e = head;
+    for (found = false; !found && e != nil; found = found) {
+      if (e.word == word) {
+        found = true;
+      } else {
+        e = e.next;
+      }
+    }
+    if (!found) {
+      e = new entry;
+      e.word = word;
+      e.next = head;
+      head = e;
+      distinct = distinct + 1;
+    }
+    e.count = e.count + 1;
+  }
+  print(distinct);
+}
+"""
+
+
+def bench_word_count(count=5000, vocabulary=300):
+    words = [f"w{(i * 7919) % vocabulary}" for i in range(count)]
+
+    def run_words(program):
+        interpreter = Interpreter(console_output=False, inp=words)
+        interpreter.run(program % count)
+
+    keyed = best_of(lambda: run_words(WORD_COUNT_MAP_PROGRAM))
+    scanned = best_of(lambda: run_words(WORD_COUNT_LIST_PROGRAM), repeat=1)
+    print(f"word_count: {count} words, {vocabulary} distinct, map builtins {keyed:.3f}s, "
+          f"struct association list {scanned:.3f}s")
+
+
+# builds a line of n "field," records, then counts its commas
+TEXT_NAIVE_PROGRAM = """
+func main() {
+  var line;
+  var i;
+  var commas;
+  line = "";
+  for (i = 0; i < %d; i = i + 1) {
+    line = line + "field,";
+  }
+  commas = 0;
+  for (i = 0; i < len(line); i = i + 1) {
+    if (substring(line, i, i + 1) == ",") {
+      commas = commas + 1;
+    }
+  }
+  print(commas);
+}
+"""
+
+TEXT_BUILTIN_PROGRAM = """
+func main() {
+  var line;
+  var i;
+  var commas;
+  line = repeat("field,", %d);
+  commas = 0;
+  for (i = find(line, ","); i >= 0; i = find(line, ",", i + 1)) {
+    commas = commas + 1;
+  }
+  print(commas);
+}
+"""
+
+
+def bench_text(records=5000):
+    naive = best_of(lambda: run_quiet(TEXT_NAIVE_PROGRAM % records))
+    native = best_of(lambda: run_quiet(TEXT_BUILTIN_PROGRAM % records))
+    print(f"text: build and count {records} records, character loop {naive:.3f}s, "
+          f"repeat() and find() {native:.3f}s")
+
+
+# splits CSV text into rows and fields with find() and substring(), keeping each row and field in a variable
+CSV_PROGRAM = """
+func main() {
+  var text;
+  var row;
+  var field;
+  var start;
+  var end;
+  var comma;
+  var matches;
+  var chars;
+  text = inputs();
+  matches = 0;
+  chars = 0;
+  for (start = 0; start < len(text); start = end + 1) {
+    end = find(text, "|", start);
+    row = substring(text, start, end);
+    for (comma = -1; comma < len(row); comma = comma) {
+      end = find(row, ",", comma + 1);
+      if (end < 0) {
+        end = len(row);
+      }
+      field = substring(row, comma + 1, end);
+      if (field == "%s") {
+        matches = matches + 1;
+      }
+      chars = chars + len(field);
+      comma = end;
+    }
+    end = start + len(row);
+  }
+  print(matches, " ", chars);
+}
+"""
+
+
+# runs fn and returns the characters that substring() and stored-view compaction copied
+def copied_characters(fn):
+    copied = [0]
+    originals = brewbuiltins.substring, interpreterv2.compact
+
+    def counting(original):
+        def wrapper(*args):
+            result = original(*args)
+            if type(result) is str:
+                copied[0] += len(result)
+            return result
+        return wrapper
+
+    brewbuiltins.substring, interpreterv2.compact = map(counting, originals)
+    try:
+        fn()
+    finally:
+        brewbuiltins.substring, interpreterv2.compact = originals
+    return copied[0]
+
+
+def bench_substring_views(rows=2000, fields=5, width=80):
+    records = [",".join(f"r{r}f{f}".ljust(width, "x") for f in range(fields)) for r in range(rows)]
+    text = "|".join(records) + "|"
+    target = records[7].split(",")[2]
+
+    def split():
+        interpreter = Interpreter(console_output=False, inp=[text])
+        interpreter.run(CSV_PROGRAM % target)
+
+    viewed = best_of(split)
+    viewed_copies = copied_characters(split)
+    saved = brewvalues.VIEW_MIN_LENGTH
+    brewvalues.VIEW_MIN_LENGTH = math.inf
+    try:
+        copied = best_of(split)
+        copied_copies = copied_characters(split)
+    finally:
+        brewvalues.VIEW_MIN_LENGTH = saved
+    print(f"substring_views: {len(text) / 1e6:.2f} MB CSV, {rows} rows of {fields} fields, "
+          f"views {viewed:.3f}s copying {viewed_copies / 1e6:.2f}M chars, "
+          f"copies {copied:.3f}s copying {copied_copies / 1e6:.2f}M chars")
+
+
+PRINT_PROGRAM = """
+func main() {
+  var i;
+  for (i = 0; i < 20000; i = i + 1) {
+    print(%s);
+  }
+}
+"""
+
+
+def bench_print():
+    for label, args in (("mixed", '"i=", i, " even ", i / 2 * 2 == i, " next ", nil, " ", i + 1'),
+                        ("literal", '"progress: ", 50, "% done ", true')):
+        elapsed = best_of(lambda: run_quiet(PRINT_PROGRAM % args))
+        print(f"print ({label} arguments): 20000 prints in {elapsed:.3f}s")
+
+
+OUTPUT_PROGRAM = """
+func main() {
+  var i;
+  for (i = 0; i < %d; i = i + 1) {
+    print("line ", i, " of output");
+  }
+}
+"""
+
+
+# peak traced bytes while fn runs
+def traced_peak(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_output_sinks(lines=10**5):
+    program = OUTPUT_PROGRAM % lines
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        with open(devnull, "w", closefd=False) as stream, contextlib.redirect_stdout(stream):
+            printed = best_of(lambda: Interpreter(console_output=True).run(program))
+        buffered = best_of(lambda: Interpreter(output_sink=brewio.FileDescriptorSink(devnull)).run(program))
+    finally:
+        os.close(devnull)
+    kept = traced_peak(lambda: Interpreter(console_output=False).run(program))
+    capped = traced_peak(lambda: Interpreter(output_sink=brewio.MemoryLogSink(max_lines=1000, spill=True)).run(program))
+    print(f"output_sinks: {lines} lines to /dev/null, print() per line {printed:.3f}s, "
+          f"FileDescriptorSink {buffered:.3f}s; peak memory keeping every line {kept / 1e6:.2f} MB, "
+          f"1000-line log spilling to disk {capped / 1e6:.2f} MB")
+
+
+INPUT_PROGRAM = """
+func main() {
+  var i;
+  var total;
+  total = 0;
+  for (i = 0; i < %d; i = i + 1) {
+    total = total + inputi();
+  }
+  print(total);
+}
+"""
+
+
+def bench_input(count=10**5, raw_count=2 * 10**6):
+    program = INPUT_PROGRAM % count
+    values = [str(i * 7919 % 1000003) for i in range(count)]
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+        file.write("\n".join(values) + "\n")
+    try:
+        listed = best_of(lambda: Interpreter(console_output=False, inp=values).run(program))
+        def run_streamed():
+            with open(file.name, "rb") as stream:
+                Interpreter(console_output=False, input_provider=brewio.StreamInput(stream)).run(program)
+
+        def run_mapped():
+            provider = brewio.MmapInput(file.name)
+            Interpreter(console_output=False, input_provider=provider).run(program)
+            provider.close()
+
+        streamed = best_of(run_streamed)
+        mapped = best_of(run_mapped)
+    finally:
+        os.unlink(file.name)
+    print(f"input: {count} inputi() calls, list inp {listed:.3f}s, StreamInput {streamed:.3f}s, MmapInput {mapped:.3f}s")
+
+    # reading alone, through get_int_input without the interpreter loop around it
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+        for start in range(0, raw_count, 10**5):
+            file.write(" ".join(map(str, range(start, start + 10**5))) + "\n")
+    try:
+        def read_all(interpreter):
+            get_int_input = interpreter.get_int_input
+            while get_int_input() is not None:
+                pass
+
+        def read_listed():
+            with open(file.name) as stream:
+                read_all(Interpreter(console_output=False, inp=stream.read().split()))
+
+        def read_streamed():
+            with open(file.name, "rb") as stream:
+                read_all(Interpreter(console_output=False, input_provider=brewio.StreamInput(stream, tokens=True)))
+
+        listed = best_of(read_listed)
+        streamed = best_of(read_streamed)
+        listed_peak = traced_peak(read_listed)
+        streamed_peak = traced_peak(read_streamed)
+    finally:
+        os.unlink(file.name)
+    print(f"input: {raw_count} whitespace-separated ints via get_int_input, split into an inp list {listed:.3f}s "
+          f"(peak {listed_peak / 1e6:.1f} MB), StreamInput {streamed:.3f}s (peak {streamed_peak / 1e6:.1f} MB)")
+
+
+BENCHMARKS = {
+    "metering": bench_metering,
+    "string_build": bench_string_build,
+    "environment_memory": bench_environment_memory,
+    "calls": bench_calls,
+    "hash_cons": bench_hash_cons,
+    "structs": bench_structs,
+    "field_caches": bench_field_caches,
+    "exceptions": bench_exceptions,
+    "errors": bench_errors,
+    "catch_dispatch": bench_catch_dispatch,
+    "builtins": bench_builtins,
+    "int_array": bench_int_array,
+    "word_count": bench_word_count,
+    "text": bench_text,
+    "substring_views": bench_substring_views,
+    "print": bench_print,
+    "output_sinks": bench_output_sinks,
+    "input": bench_input,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,375 @@
+# Native builtin functions. Each builtin is a plain callable taking the interpreter, the call
+# node (for error lines) and the already-evaluated arguments. BUILTINS maps (name, arity) to
+# the callable; an arity of None accepts any number of arguments.
+import re
+from array import array
+
+from brewvalues import (
+    FORMATTERS, NIL, STRING_TYPES, BrewinMap, IntArray, StringView, compact, entry_size, find, format_value,
+    map_key, new_int_array, substring,
+)
+from intbase import ErrorType
+
+BUILTINS = {}
+
+
+# decorator adding a function to the default registry
+def builtin(name, arity):
+    def register(function):
+        BUILTINS[(name, arity)] = function
+        return function
+    return register
+
+
+# an exact-arity builtin wins over a variadic one of the same name
+def lookup_builtin(builtins, name, arity):
+    function = builtins.get((name, arity))
+    if function is None:
+        function = builtins.get((name, None))
+    return function
+
+
+# each argument's formatter is picked by its type and the parts are joined in one pass
+@builtin("print", None)
+def builtin_print(interpreter, node, *args):
+    if len(args) == 1:
+        interpreter.output(format_value(args[0]))
+    else:
+        interpreter.output("".join([FORMATTERS[type(arg)](arg) for arg in args]))
+    return NIL
+
+
+# input would be read from the console, which a streaming run does not allow (see iter_run)
+def check_console_input(interpreter, node):
+    if interpreter.input_provider is None and not interpreter.inp and not interpreter.console_input_allowed:
+        interpreter.error(ErrorType.FAULT_ERROR, "Console input is not available to a streaming run", node=node)
+
+
+def read_int(interpreter, node):
+    check_console_input(interpreter, node)
+    try:
+        value = interpreter.get_int_input()
+    except ValueError:
+        value = None
+    if value is None:
+        interpreter.error(ErrorType.TYPE_ERROR, "inputi() did not receive an integer", node=node)
+    return value
+
+
+@builtin("inputi", 0)
+def builtin_inputi(interpreter, node):
+    return read_int(interpreter, node)
+
+
+@builtin("inputi", 1)
+def builtin_inputi_prompt(interpreter, node, prompt):
+    interpreter.output(format_value(prompt))
+    return read_int(interpreter, node)
+
+
+def read_string(interpreter, node):
+    check_console_input(interpreter, node)
+    text = interpreter.get_input()
+    return NIL if text is None else text
+
+
+@builtin("inputs", 0)
+def builtin_inputs(interpreter, node):
+    return read_string(interpreter, node)
+
+
+@builtin("inputs", 1)
+def builtin_inputs_prompt(interpreter, node, prompt):
+    interpreter.output(format_value(prompt))
+    return read_string(interpreter, node)
+
+
+# a string argument's text as a str
+def check_string(interpreter, node, name, value):
+    return str(check_string_value(interpreter, node, name, value))
+
+
+# a string argument as is, so views and ropes can be searched and sliced in place
+def check_string_value(interpreter, node, name, value):
+    if type(value) not in STRING_TYPES:
+        interpreter.error(ErrorType.TYPE_ERROR, "{}() requires string arguments", node=node, args=(name,))
+    return value
+
+
+def check_int(interpreter, node, name, value):
+    if type(value) is not int:
+        interpreter.error(
+            ErrorType.TYPE_ERROR, "{}() requires integer positions and counts", node=node, args=(name,)
+        )
+    return value
+
+
+# refuses to build a string that could never be stored under the quota
+def check_result_length(interpreter, node, length):
+    if length > interpreter.memory_limit:
+        interpreter.memory_limit_exceeded(node)
+
+
+@builtin("len", 1)
+def builtin_len(interpreter, node, text):
+    if type(text) not in STRING_TYPES:
+        interpreter.error(ErrorType.TYPE_ERROR, "len() requires a string", node=node)
+    return len(text)
+
+
+# characters start .. end - 1 of text; long substrings are views of text's buffer
+@builtin("substring", 3)
+def builtin_substring(interpreter, node, text, start, end):
+    check_string_value(interpreter, node, "substring", text)
+    check_int(interpreter, node, "substring", start)
+    check_int(interpreter, node, "substring", end)
+    if not 0 <= start <= end <= len(text):
+        interpreter.error(ErrorType.FAULT_ERROR, "substring({}, {}) is out of range", node=node, args=(start, end))
+    return substring(text, start, end)
+
+
+# index of the first occurrence of needle at or after start, or -1
+@builtin("find", 2)
+def builtin_find(interpreter, node, text, needle):
+    return builtin_find_from(interpreter, node, text, needle, 0)
+
+
+@builtin("find", 3)
+def builtin_find_from(interpreter, node, text, needle, start):
+    check_string_value(interpreter, node, "find", text)
+    check_string_value(interpreter, node, "find", needle)
+    check_int(interpreter, node, "find", start)
+    if not 0 <= start <= len(text):
+        interpreter.error(ErrorType.FAULT_ERROR, "find() start {} is out of range", node=node, args=(start,))
+    return find(text, needle, start)
+
+
+@builtin("repeat", 2)
+def builtin_repeat(interpreter, node, text, count):
+    text = check_string(interpreter, node, "repeat", text)
+    check_int(interpreter, node, "repeat", count)
+    if count < 0:
+        interpreter.error(ErrorType.FAULT_ERROR, "repeat() count must not be negative", node=node)
+    check_result_length(interpreter, node, len(text) * count)
+    return text * count
+
+
+# join(separator, part, ...)
+@builtin("join", None)
+def builtin_join(interpreter, node, *args):
+    if not args:
+        interpreter.error(ErrorType.NAME_ERROR, "join() requires a separator", node=node)
+    separator, *parts = [check_string(interpreter, node, "join", arg) for arg in args]
+    check_result_length(interpreter, node, sum(map(len, parts)) + len(separator) * max(len(parts) - 1, 0))
+    return separator.join(parts)
+
+
+# the whole text must be a Brewin integer literal, optionally negated; int() alone would also
+# take surrounding whitespace, underscores and non-ASCII digits
+INT_TEXT = re.compile(r"-?[0-9]+")
+
+
+@builtin("toint", 1)
+def builtin_toint(interpreter, node, text):
+    if type(text) not in STRING_TYPES:
+        interpreter.error(ErrorType.TYPE_ERROR, "toint() requires a string", node=node)
+    text = str(text)
+    if INT_TEXT.fullmatch(text) is not None:
+        try:
+            return int(text)
+        except ValueError:  # more digits than int() converts
+            pass
+    interpreter.error(ErrorType.TYPE_ERROR, "Unable to convert {} to an integer", node=node, args=(text,))
+
+
+def int_arguments(interpreter, node, name, args):
+    if not args:
+        interpreter.error(ErrorType.NAME_ERROR, "{}() requires at least one argument", node=node, args=(name,))
+    for arg in args:
+        if type(arg) is not int:
+            interpreter.error(ErrorType.TYPE_ERROR, "{}() requires integer arguments", node=node, args=(name,))
+    return args
+
+
+@builtin("min", None)
+def builtin_min(interpreter, node, *args):
+    return min(int_arguments(interpreter, node, "min", args))
+
+
+@builtin("max", None)
+def builtin_max(interpreter, node, *args):
+    return max(int_arguments(interpreter, node, "max", args))
+
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+INT64_SIZE = 8
+
+
+def check_container(interpreter, node, name, value, container_type):
+    if value is NIL:
+        interpreter.error(ErrorType.FAULT_ERROR, "{}() called on nil", node=node, args=(name,))
+    interpreter.error(ErrorType.TYPE_ERROR, "{}() requires {}", node=node, args=(name, container_type))
+
+
+def array_items(interpreter, node, name, value):
+    if type(value) is not IntArray:
+        check_container(interpreter, node, name, value, "an array")
+    return value.items
+
+
+def check_index(interpreter, node, items, index):
+    if type(index) is not int:
+        interpreter.error(ErrorType.TYPE_ERROR, "Array index must be an integer", node=node)
+    if not 0 <= index < len(items):
+        interpreter.error(ErrorType.FAULT_ERROR, "Array index {} is out of range", node=node, args=(index,))
+
+
+def check_element(interpreter, node, value):
+    if type(value) is not int:
+        interpreter.error(ErrorType.TYPE_ERROR, "Arrays can only hold integers", node=node)
+    if not INT64_MIN <= value <= INT64_MAX:
+        interpreter.error(ErrorType.FAULT_ERROR, "{} does not fit in an array element", node=node, args=(value,))
+
+
+def check_length(interpreter, node, length):
+    if type(length) is not int or length < 0:
+        interpreter.error(ErrorType.TYPE_ERROR, "Array length must be a non-negative integer", node=node)
+    # refuse an array that could never be stored under the quota
+    if length * INT64_SIZE > interpreter.memory_limit:
+        interpreter.memory_limit_exceeded(node)
+
+
+# a new array is charged to the memory quota once, however many variables refer to it
+def charged_array(interpreter, node, array_value):
+    interpreter.charge_memory(array_value.size, node)
+    return array_value
+
+
+@builtin("array", 1)
+def builtin_array(interpreter, node, length):
+    check_length(interpreter, node, length)
+    return charged_array(interpreter, node, new_int_array(length, 0, interpreter.freed_memory))
+
+
+@builtin("array", 2)
+def builtin_array_fill(interpreter, node, length, value):
+    check_length(interpreter, node, length)
+    check_element(interpreter, node, value)
+    return charged_array(interpreter, node, new_int_array(length, value, interpreter.freed_memory))
+
+
+@builtin("get", 2)
+def builtin_get(interpreter, node, container, key):
+    if type(container) is IntArray and type(key) is int and 0 <= key < len(container.items):
+        return container.items[key]
+    if type(container) is BrewinMap:
+        return container.items.get(checked_key(interpreter, node, key), NIL)
+    items = array_items(interpreter, node, "get", container)
+    check_index(interpreter, node, items, key)
+    return items[key]
+
+
+@builtin("set", 3)
+def builtin_set(interpreter, node, container, index, value):
+    if (type(container) is IntArray and type(index) is int and 0 <= index < len(container.items)
+            and type(value) is int and INT64_MIN <= value <= INT64_MAX):
+        container.items[index] = value
+        return NIL
+    items = array_items(interpreter, node, "set", container)
+    check_index(interpreter, node, items, index)
+    check_element(interpreter, node, value)
+    items[index] = value
+    return NIL
+
+
+@builtin("size", 1)
+def builtin_size(interpreter, node, container):
+    if type(container) is BrewinMap:
+        return len(container.items)
+    if type(container) is not IntArray:
+        check_container(interpreter, node, "size", container, "an array or a map")
+    return len(container.items)
+
+
+@builtin("fill", 2)
+def builtin_fill(interpreter, node, container, value):
+    items = array_items(interpreter, node, "fill", container)
+    check_element(interpreter, node, value)
+    items[:] = array("q", (value,)) * len(items)
+    return NIL
+
+
+@builtin("copy", 1)
+def builtin_copy(interpreter, node, container):
+    items = array_items(interpreter, node, "copy", container)
+    check_length(interpreter, node, len(items))
+    return charged_array(interpreter, node, IntArray(items[:], interpreter.freed_memory))
+
+
+# copy(source, source_start, target, target_start, count), like a bulk memmove
+@builtin("copy", 5)
+def builtin_copy_range(interpreter, node, source, source_start, target, target_start, count):
+    source_items = array_items(interpreter, node, "copy", source)
+    target_items = array_items(interpreter, node, "copy", target)
+    for start, items in ((source_start, source_items), (target_start, target_items)):
+        if type(start) is not int or type(count) is not int:
+            interpreter.error(ErrorType.TYPE_ERROR, "copy() positions must be integers", node=node)
+        if start < 0 or count < 0 or start + count > len(items):
+            interpreter.error(ErrorType.FAULT_ERROR, "copy() range is out of bounds", node=node)
+    target_items[target_start:target_start + count] = source_items[source_start:source_start + count]
+    return NIL
+
+
+def map_items(interpreter, node, name, value):
+    if type(value) is not BrewinMap:
+        check_container(interpreter, node, name, value, "a map")
+    return value.items
+
+
+def checked_key(interpreter, node, value):
+    key = map_key(value)
+    if key is None:
+        interpreter.error(ErrorType.TYPE_ERROR, "Map keys must be integers, booleans or strings", node=node)
+    return key
+
+
+@builtin("map", 0)
+def builtin_map(interpreter, node):
+    container = BrewinMap(interpreter.freed_memory)
+    interpreter.charge_memory(container.size, node)
+    return container
+
+
+# stored entries are charged to the memory quota like variables, through the map's size
+@builtin("put", 3)
+def builtin_put(interpreter, node, container, key, value):
+    if type(value) is StringView:
+        value = compact(value)
+    items = map_items(interpreter, node, "put", container)
+    key = checked_key(interpreter, node, key)
+    delta = entry_size(key, value)
+    if key in items:
+        delta -= entry_size(key, items[key])
+    container.size += delta
+    interpreter.charge_memory(delta, node)
+    items[key] = value
+    return NIL
+
+
+@builtin("has", 2)
+def builtin_has(interpreter, node, container, key):
+    return checked_key(interpreter, node, key) in map_items(interpreter, node, "has", container)
+
+
+# returns whether the key was present
+@builtin("delete", 2)
+def builtin_delete(interpreter, node, container, key):
+    items = map_items(interpreter, node, "delete", container)
+    key = checked_key(interpreter, node, key)
+    if key not in items:
+        return False
+    released = entry_size(key, items.pop(key))
+    container.size -= released
+    interpreter.charge_memory(-released, node)
+    return True
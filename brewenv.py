@@ -0,0 +1,98 @@
+# Variable storage for one Brewin function activation
+from brewvalues import value_size
+
+FRAME_POOL_LIMIT = 64  # idle frames each function keeps for reuse
+
+
+# a variable's value and declared type (as matches_type takes it, None if untyped); shadows
+# `previous` until its scope is popped
+class Binding:
+    __slots__ = ("value", "var_type", "depth", "previous")
+
+    def __init__(self, value, var_type, depth, previous):
+        self.value = value
+        self.var_type = var_type
+        self.depth = depth
+        self.previous = previous
+
+
+# maps each visible name straight to its innermost Binding, so define, lookup and
+# assignment are single dict operations; scopes only remember which names to unwind.
+# Bindings dropped by pop_scope are kept in `spare` and recycled by later definitions.
+class Environment:
+    __slots__ = ("bindings", "scopes", "spare")
+
+    def __init__(self, slot_count=0):
+        self.bindings = {}
+        self.scopes = [[]]
+        self.spare = [Binding(None, None, 0, None) for _ in range(slot_count)]
+
+    # returns False if name is already defined in the innermost scope
+    def define(self, name, value, var_type=None):
+        depth = len(self.scopes)
+        previous = self.bindings.get(name)
+        if previous is not None and previous.depth == depth:
+            return False
+        if self.spare:
+            binding = self.spare.pop()
+            binding.value = value
+            binding.var_type = var_type
+            binding.depth = depth
+            binding.previous = previous
+        else:
+            binding = Binding(value, var_type, depth, previous)
+        self.bindings[name] = binding
+        self.scopes[-1].append(name)
+        return True
+
+    def lookup(self, name):
+        return self.bindings.get(name)
+
+    def push_scope(self):
+        self.scopes.append([])
+
+    # drops the innermost scope's bindings and returns the bytes their values held
+    def pop_scope(self):
+        bindings = self.bindings
+        released = 0
+        spare = self.spare
+        for name in self.scopes.pop():
+            binding = bindings[name]
+            released += value_size(binding.value)
+            if binding.previous is None:
+                del bindings[name]
+            else:
+                bindings[name] = binding.previous
+            binding.value = binding.previous = None
+            spare.append(binding)
+        return released
+
+    # pops scopes until `depth` remain and returns the bytes their values held
+    def unwind(self, depth):
+        released = 0
+        while len(self.scopes) > depth:
+            released += self.pop_scope()
+        return released
+
+
+# idle Environments for one (name, arity) function, each preallocated with one Binding
+# per variable the function can define, so a call reuses a frame instead of building one
+class FramePool:
+    __slots__ = ("free", "slot_count")
+
+    def __init__(self, slot_count):
+        self.free = []
+        self.slot_count = slot_count
+
+    def acquire(self):
+        if self.free:
+            return self.free.pop()
+        return Environment(self.slot_count)
+
+    # empties a frame the call is done with and returns the bytes its values held
+    def release(self, frame):
+        released = frame.unwind(0)
+        frame.scopes.append([])
+        if len(self.free) < FRAME_POOL_LIMIT:
+            self.free.append(frame)
+        return released
@@ -0,0 +1,285 @@
+# Output sinks for InterpreterBase.output. A sink takes one line at a time through write(),
+# returns what it kept through lines(), and is flushed at the end of every run.
+# Input providers for InterpreterBase.get_input. A provider hands out one value at a time
+# through read() (a str) or read_int() (an int, ValueError if the value is not one), both
+# returning None once the input is exhausted; `cursor` counts the values handed out.
+import io
+import mmap
+import os
+import re
+import sys
+import tempfile
+
+FLUSH_SIZE = 1 << 16  # bytes (as UTF-8) a FileDescriptorSink buffers before writing them out
+CHUNK_SIZE = 1 << 20  # bytes a StreamInput reads at a time
+
+
+# bytes a line takes when written out as UTF-8, with its newline
+def line_size(line):
+    return (len(line) if line.isascii() else len(line.encode())) + 1
+
+
+class NullSink:
+    def write(self, line):
+        pass
+
+    def flush(self):
+        pass
+
+    def lines(self):
+        return []
+
+    def reset(self):
+        pass
+
+
+# the default sink: echoes each line to stdout if `echo` is set and keeps every line
+class ConsoleLogSink:
+    def __init__(self, echo=True):
+        self.echo = echo
+        self.log = []
+
+    def write(self, line):
+        if self.echo:
+            print(line)
+        self.log.append(line)
+
+    def flush(self):
+        pass
+
+    def lines(self):
+        return self.log
+
+    def reset(self):
+        self.log = []
+
+
+# buffers lines and writes them to a file descriptor in blocks of at least flush_size bytes;
+# lines are not kept, so lines() is empty
+class FileDescriptorSink:
+    def __init__(self, fd=None, flush_size=FLUSH_SIZE):
+        self.fd = sys.stdout.fileno() if fd is None else fd
+        self.flush_size = flush_size
+        self.parts = []
+        self.pending = 0
+
+    def write(self, line):
+        self.parts.append(line)
+        self.pending += line_size(line)
+        if self.pending >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self.parts:
+            return
+        self.parts.append("")
+        data = memoryview("\n".join(self.parts).encode())
+        self.parts = []
+        self.pending = 0
+        while data:
+            written = os.write(self.fd, data)
+            data = data[written:]
+
+    def lines(self):
+        return []
+
+    def reset(self):
+        self.flush()
+
+
+def _escape(line):
+    return line.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+_ESCAPED = {"n": "\n", "\\": "\\"}
+
+
+def _unescape(record):
+    if "\\" not in record:
+        return record
+    return re.sub(r"\\(.)", lambda match: _ESCAPED[match.group(1)], record)
+
+
+# keeps lines in memory until max_lines lines or max_bytes bytes (as UTF-8, newlines included)
+# are held. Past the cap, later lines are appended to a temporary file if `spill` is set and
+# dropped (and counted in `dropped`) otherwise; lines() returns everything kept, in order
+class MemoryLogSink:
+    def __init__(self, max_lines=None, max_bytes=None, spill=False):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self.log = []
+        self.size = 0
+        self.dropped = 0
+        self.spill_file = None
+
+    def write(self, line):
+        size = line_size(line)
+        if self.spill_file is None and not self.full(size):
+            self.log.append(line)
+            self.size += size
+        elif self.spill:
+            if self.spill_file is None:
+                self.spill_file = tempfile.TemporaryFile("w+", encoding="utf-8", newline="\n")
+            self.spill_file.write(_escape(line) + "\n")
+        else:
+            self.dropped += 1
+
+    def full(self, size):
+        if self.max_lines is not None and len(self.log) >= self.max_lines:
+            return True
+        return self.max_bytes is not None and self.size + size > self.max_bytes
+
+    def flush(self):
+        if self.spill_file is not None:
+            self.spill_file.flush()
+
+    def lines(self):
+        if self.spill_file is None:
+            return self.log
+        self.spill_file.seek(0)
+        spilled = [_unescape(record[:-1]) for record in self.spill_file]
+        self.spill_file.seek(0, os.SEEK_END)
+        return self.log + spilled
+
+    def reset(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+        self.log = []
+        self.size = 0
+        self.dropped = 0
+
+
+_END = object()  # IteratorInput's marker for an exhausted iterator; None is a value
+
+
+# values from any iterable, e.g. a generator; ints are handed to inputi as they are
+class IteratorInput:
+    def __init__(self, values):
+        self.values = iter(values)
+        self.cursor = 0
+
+    def read(self):
+        value = next(self.values, _END)
+        if value is _END:
+            return None
+        self.cursor += 1
+        return str(value)
+
+    def read_int(self):
+        value = next(self.values, _END)
+        if value is _END:
+            return None
+        self.cursor += 1
+        if type(value) is int:
+            return value
+        try:
+            return int(value)
+        except TypeError:
+            raise ValueError(f"{value!r} is not an integer") from None
+
+    # an iterator cannot be rewound, so reading goes on from where it stopped
+    def reset(self):
+        self.cursor = 0
+
+
+# values from a binary stream (a file opened "rb", sys.stdin.buffer, an mmap) read
+# chunk_size bytes at a time. Each line is one value, as with input(); with tokens set, each
+# whitespace-separated word is. Only the current chunk is held, and read_int parses all of
+# it with one map(int, ...) the first time it is asked for an int from that chunk.
+class StreamInput:
+    def __init__(self, stream, chunk_size=CHUNK_SIZE, tokens=False):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.tokens = tokens
+        self.start()
+
+    def start(self):
+        self.values = []
+        self.position = 0
+        self.ints = []  # the current chunk's values as ints, once parsed and if all are integers
+        self.parsed = None  # the chunk that ints was parsed from
+        self.partial = b""  # an unfinished value at the end of the last chunk; None at the end
+        self.cursor = 0
+
+    # loads the next chunk's values; returns False at the end of the stream
+    def fill(self):
+        while self.position >= len(self.values):
+            if self.partial is None:
+                return False
+            data = self.stream.read(self.chunk_size)
+            if not data:
+                values = [self.partial] if self.partial else []
+                self.partial = None
+            elif self.tokens:
+                data = self.partial + data
+                values = data.split()
+                self.partial = values.pop() if values and not data[-1:].isspace() else b""
+            else:
+                data = self.partial + data
+                cut = data.rfind(b"\n")
+                if cut < 0:
+                    self.partial = data
+                    continue
+                values = data[:cut].split(b"\n")
+                self.partial = data[cut + 1:]
+            self.values = values
+            self.position = 0
+            self.ints = []
+        return True
+
+    def read(self):
+        if self.position >= len(self.values) and not self.fill():
+            return None
+        value = self.values[self.position]
+        self.position += 1
+        self.cursor += 1
+        return value.rstrip(b"\r").decode()
+
+    def read_int(self):
+        position = self.position
+        if position < len(self.ints):
+            self.position = position + 1
+            self.cursor += 1
+            return self.ints[position]
+        if position >= len(self.values):
+            if not self.fill():
+                return None
+            position = 0
+        if self.parsed is not self.values:
+            self.parsed = self.values
+            try:
+                self.ints = list(map(int, self.values))
+            except ValueError:
+                self.ints = []  # not all integers; parse value by value
+        self.position = position + 1
+        self.cursor += 1
+        if self.ints:
+            return self.ints[position]
+        return int(self.values[position])
+
+    # starts over from the beginning if the stream can seek (an mmap always can); otherwise
+    # reading goes on from where it stopped, with the count of values handed out restarted
+    def reset(self):
+        seekable = getattr(self.stream, "seekable", None)
+        if seekable is not None and not seekable():
+            self.cursor = 0
+            return
+        if self.cursor:
+            self.stream.seek(0)
+        self.start()
+
+
+# values from a memory-mapped file; the OS pages the file in as the chunks are taken
+class MmapInput(StreamInput):
+    def __init__(self, path, chunk_size=CHUNK_SIZE, tokens=False):
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size:
+                stream = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                stream = io.BytesIO()  # mmap refuses an empty file
+        super().__init__(stream, chunk_size, tokens)
+
+    def close(self):
+        self.stream.close()
@@ -22,6 +22,14 @@ reserved_map = {}
 for r in reserved:
     reserved_map[r.lower()] = r
 
+# identifiers and string literals seen by the current parse, so every occurrence of
+# a name shares one str object and later dict lookups can succeed on identity
+symbol_table = {}
+
+
+def intern_symbol(text):
+    return symbol_table.setdefault(text, text)
+
 tokens = reserved + (
     "LPAREN",
     "RPAREN",
@@ -107,6 +115,7 @@ def t_NUMBER(t):
 def t_NAME(t):
     r"[A-Za-z_][\w_]*"
     t.type = reserved_map.get(t.value, "NAME")
+    t.value = intern_symbol(t.value)
     return t
 
 def t_newline(t):
@@ -121,7 +130,7 @@ def t_comment(t):
 
 def t_STRING(t):
     r'".*?"'
-    t.value = t.value[1:-1]
+    t.value = intern_symbol(t.value[1:-1])
     return t
 
 
@@ -132,5 +141,9 @@ def t_error(t):
 def reset_lineno():
     lexer.lineno = 1
 
+
+def reset_symbols():
+    symbol_table.clear()
+
 # Build the lexer
 lexer = lex.lex()
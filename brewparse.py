@@ -1,4 +1,10 @@
-from element import Element
+import threading
+
+from element import (
+    BINARY_OP_NODES, ArgNode, AssignNode, BoolNode, CatchNode, Element, FCallNode, FieldAssignNode,
+    FieldDefNode, FieldPathNode, ForNode, FuncNode, IfNode, IntNode, NegNode, NewNode, NilNode, NotNode, ProgramNode, RaiseNode,
+    ReturnNode, StringNode, StructNode, TryNode, VarDefNode, VarNode, make_frozen,
+)
 from brewlex import *
 from intbase import InterpreterBase
 from ply import yacc
@@ -14,6 +20,10 @@ precedence = (
     ("right", "UMINUS", "NOT"),
 )
 
+def set_line(p, token_index):
+    p[0].line_num = p.lineno(token_index)
+
+
 def collapse_items(p, group_index, singleton_index):
     if len(p) == 2:
         p[0] = [p[1]]
@@ -26,9 +36,9 @@ def p_program(p):
     """program : structs funcs
     | funcs"""
     if len(p) == 2:
-        p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=[], functions=p[1])
+        p[0] = ProgramNode(structs=[], functions=p[1])
     else:
-        p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=p[1], functions=p[2])
+        p[0] = ProgramNode(structs=p[1], functions=p[2])
 
 def p_structs(p):
     """structs : structs struct
@@ -37,7 +47,8 @@ def p_structs(p):
 
 def p_struct(p):
    "struct : STRUCT NAME LBRACE fields RBRACE"
-   p[0] = Element(InterpreterBase.STRUCT_NODE, name=p[2], fields=p[4])
+   p[0] = StructNode(name=p[2], fields=p[4])
+   set_line(p, 1)
 
 def p_fields(p):
    """fields : fields field
@@ -46,7 +57,8 @@ def p_fields(p):
 
 def p_field(p):
   "field : NAME COLON NAME SEMI"  # field_name: type
-  p[0] = Element(InterpreterBase.FIELD_DEF_NODE, name=p[1], var_type=p[3])
+  p[0] = FieldDefNode(name=p[1], var_type=p[3])
+  set_line(p, 1)
 
 def p_funcs(p):
     """funcs : funcs func
@@ -58,17 +70,19 @@ def p_func(p):
     """func : FUNC NAME LPAREN formal_args RPAREN COLON NAME LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN COLON NAME LBRACE statements RBRACE"""
     if len(p) == 11:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = p[7], statements=p[9])
+        p[0] = FuncNode(name=p[2], args=p[4], return_type = p[7], statements=p[9])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = p[6], statements=p[8])
+        p[0] = FuncNode(name=p[2], args=[], return_type = p[6], statements=p[8])
+    set_line(p, 1)
 
 def p_func2(p):
     """func : FUNC NAME LPAREN formal_args RPAREN LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN LBRACE statements RBRACE"""
     if len(p) == 9:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = None, statements=p[7])
+        p[0] = FuncNode(name=p[2], args=p[4], return_type = None, statements=p[7])
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = None, statements=p[6])
+        p[0] = FuncNode(name=p[2], args=[], return_type = None, statements=p[6])
+    set_line(p, 1)
 
 def p_formal_args(p):
     """formal_args : formal_args COMMA formal_arg
@@ -80,9 +94,10 @@ def p_formal_arg(p):
     """formal_arg : NAME COLON NAME
     | NAME"""
     if len(p) == 2:
-      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = None)
+      p[0] = ArgNode(name=p[1], var_type = None)
     else:
-      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = p[3])
+      p[0] = ArgNode(name=p[1], var_type = p[3])
+    set_line(p, 1)
 
 def p_statements(p):
     """statements : statements statement
@@ -96,15 +111,20 @@ def p_statement___assign(p):
 
 def p_assign(p):
     "assign : variable_w_dot ASSIGN expression"
-    p[0] = Element("=", name=p[1], expression=p[3])
+    if isinstance(p[1], FieldPathNode):
+        p[0] = FieldAssignNode(path=p[1], expression=p[3])
+    else:
+        p[0] = AssignNode(name=p[1], expression=p[3])
+    set_line(p, 2)
 
 def p_statement___var(p):
     """statement : VAR variable COLON NAME SEMI
     | VAR variable SEMI"""
     if len(p) == 6:
-      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=p[4])
+      p[0] = VarDefNode(name=p[2], var_type=p[4])
     else:
-      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=None)
+      p[0] = VarDefNode(name=p[2], var_type=None)
+    set_line(p, 1)
 
 def p_variable(p):
     "variable : NAME"
@@ -114,32 +134,37 @@ def p_variable_w_dot(p):
     """variable_w_dot : variable_w_dot DOT NAME
     | NAME"""
     if len(p) == 4:
-        p[0] = p[1] + "." + p[3]
+        if isinstance(p[1], FieldPathNode):
+            p[0] = FieldPathNode(base=p[1].base, fields=p[1].fields + (p[3],))
+        else:
+            p[0] = FieldPathNode(base=p[1], fields=(p[3],))
+        set_line(p, 2)
     else:
         p[0] = p[1]
+    p.set_lineno(0, p.lineno(1))
 
 def p_statement_if(p):
     """statement : IF LPAREN expression RPAREN LBRACE statements RBRACE
     | IF LPAREN expression RPAREN LBRACE statements RBRACE ELSE LBRACE statements RBRACE
     """
     if len(p) == 8:
-        p[0] = Element(
-            InterpreterBase.IF_NODE,
+        p[0] = IfNode(
             condition=p[3],
             statements=p[6],
             else_statements=None,
         )
     else:
-        p[0] = Element(
-            InterpreterBase.IF_NODE,
+        p[0] = IfNode(
             condition=p[3],
             statements=p[6],
             else_statements=p[10],
         )
+    set_line(p, 1)
 
 def p_statement_try(p):
     """statement : TRY LBRACE statements RBRACE catchers"""
-    p[0] = Element(InterpreterBase.TRY_NODE, statements=p[3], catchers=p[5])
+    p[0] = TryNode(statements=p[3], catchers=p[5])
+    set_line(p, 1)
 
 def p_catches(p):
     """catchers : catchers catch
@@ -148,15 +173,18 @@ def p_catches(p):
 
 def p_catch(p):
     "catch : CATCH STRING LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.CATCH_NODE, exception_type=p[2], statements=p[4])
+    p[0] = CatchNode(exception_type=p[2], statements=p[4])
+    set_line(p, 1)
 
 def p_statement_for(p):
     "statement : FOR LPAREN assign SEMI expression SEMI assign RPAREN LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.FOR_NODE, init=p[3], condition=p[5], update=p[7], statements=p[10])
+    p[0] = ForNode(init=p[3], condition=p[5], update=p[7], statements=p[10])
+    set_line(p, 1)
 
 def p_statement_raise(p):
     "statement : RAISE expression SEMI"
-    p[0] = Element(InterpreterBase.RAISE_NODE, exception_type=p[2])
+    p[0] = RaiseNode(exception_type=p[2])
+    set_line(p, 1)
 
 def p_statement_expr(p):
     "statement : expression SEMI"
@@ -170,21 +198,25 @@ def p_statement_return(p):
         expr = p[2]
     else:
         expr = None
-    p[0] = Element(InterpreterBase.RETURN_NODE, expression=expr)
+    p[0] = ReturnNode(expression=expr)
+    set_line(p, 1)
 
 
 def p_expression_not(p):
     "expression : NOT expression"
-    p[0] = Element(InterpreterBase.NOT_NODE, op1=p[2])
+    p[0] = NotNode(op1=p[2])
+    set_line(p, 1)
 
 
 def p_expression_uminus(p):
     "expression : MINUS expression %prec UMINUS"
-    p[0] = Element(InterpreterBase.NEG_NODE, op1=p[2])
+    p[0] = NegNode(op1=p[2])
+    set_line(p, 1)
 
 def p_expression_new(p):
     "expression : NEW NAME"
-    p[0] = Element(InterpreterBase.NEW_NODE, var_type=p[2])
+    p[0] = NewNode(var_type=p[2])
+    set_line(p, 1)
 
 
 def p_arith_expression_binop(p):
@@ -198,7 +230,8 @@ def p_arith_expression_binop(p):
     | expression MINUS expression
     | expression MULTIPLY expression
     | expression DIVIDE expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = BINARY_OP_NODES[p[2]](op1=p[1], op2=p[3])
+    set_line(p, 2)
 
 
 def p_expression_group(p):
@@ -209,43 +242,53 @@ def p_expression_group(p):
 def p_expression_and_or(p):
     """expression : expression OR expression
     | expression AND expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = BINARY_OP_NODES[p[2]](op1=p[1], op2=p[3])
+    set_line(p, 2)
 
 
 def p_expression_number(p):
     "expression : NUMBER"
-    p[0] = Element(InterpreterBase.INT_NODE, val=p[1])
+    p[0] = IntNode(val=p[1])
+    set_line(p, 1)
 
 
 def p_expression_bool(p):
     """expression : TRUE
     | FALSE"""
     bool_val = p[1] == InterpreterBase.TRUE_DEF
-    p[0] = Element(InterpreterBase.BOOL_NODE, val=bool_val)
+    p[0] = BoolNode(val=bool_val)
+    set_line(p, 1)
 
 
 def p_expression_nil(p):
     "expression : NIL"
-    p[0] = Element(InterpreterBase.NIL_NODE)
+    p[0] = NilNode()
+    set_line(p, 1)
 
 
 def p_expression_string(p):
     "expression : STRING"
-    p[0] = Element(InterpreterBase.STRING_NODE, val=p[1])
+    p[0] = StringNode(val=p[1])
+    set_line(p, 1)
 
 
 def p_expression_variable(p):
     "expression : variable_w_dot"
-    p[0] = Element(InterpreterBase.VAR_NODE, name=p[1])
+    if isinstance(p[1], FieldPathNode):
+        p[0] = p[1]
+    else:
+        p[0] = VarNode(name=p[1])
+        set_line(p, 1)
 
 
 def p_func_call(p):
     """expression : NAME LPAREN args RPAREN
     | NAME LPAREN RPAREN"""
     if len(p) == 5:
-        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=p[3])
+        p[0] = FCallNode(name=p[1], args=p[3])
     else:
-        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=[])
+        p[0] = FCallNode(name=p[1], args=[])
+    set_line(p, 1)
 
 
 def p_expression_args(p):
@@ -261,14 +304,62 @@ def p_error(p):
         print("Syntax error at EOF")
 
 
+# fields of a statement that hold expressions; every node below them is an expression too
+EXPRESSION_FIELDS = {
+    AssignNode: ("expression",),
+    FieldAssignNode: ("path", "expression"),
+    FCallNode: ("args",),
+    IfNode: ("condition",),
+    ForNode: ("condition",),
+    ReturnNode: ("expression",),
+    RaiseNode: ("exception_type",),
+}
+
+
+# Rebuilds the tree bottom-up so structurally identical subtrees (and statement lists,
+# which become tuples) are a single shared frozen node. Expressions are shared across
+# lines and carry no line number; an error in one reports the line of the statement it
+# is part of (see Interpreter.run_block). Statements and declarations keep their lines,
+# so each is a thin node per line over the shared expressions below it.
+def share_subtrees(value, table, expression=False):
+    if isinstance(value, Element):
+        node_class = type(value)
+        expression_fields = () if expression else EXPRESSION_FIELDS.get(node_class, ())
+        fields = {
+            key: share_subtrees(getattr(value, key), table, expression or key in expression_fields)
+            for key in value.field_names
+        }
+        line_num = None if expression else value.line_num
+        key = (node_class, line_num, tuple(fields.items()))
+        node = table.get(key)
+        if node is None:
+            node = make_frozen(node_class, line_num, fields)
+            table[key] = node
+        return node
+    if isinstance(value, list):
+        items = tuple(share_subtrees(item, table, expression) for item in value)
+        return table.setdefault(items, items)
+    return value
+
+
+# the PLY parser, the lexer and the symbol table are module globals, so one parse runs at a time
+_parse_lock = threading.Lock()
+
+
 # exported function
-def parse_program(program):
-    reset_lineno()
-    ast = yacc.parse(program)
+def parse_program(program, hash_cons=False):
+    with _parse_lock:
+        reset_lineno()
+        reset_symbols()
+        ast = parser.parse(program)
+        parser.restart()  # PLY's symbol stack would otherwise keep the parse tree alive
+        reset_symbols()  # the AST now holds the only references the parse needs
     if ast is None:
         raise SyntaxError("Syntax error")
+    if hash_cons:
+        ast = share_subtrees(ast, {})
     return ast
 
 
 # generate our parser
-yacc.yacc() # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
+parser = yacc.yacc() # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
@@ -0,0 +1,386 @@
+# Runtime representations of Brewin values: ints, bools and strings are native Python
+# values (long strings may be Ropes, long substrings StringViews), nil is the NIL singleton,
+# struct instances are Structs, int arrays are IntArrays and maps are BrewinMaps
+import sys
+from array import array
+from collections import deque
+
+ROPE_MIN_LENGTH = 256  # concatenations shorter than this produce a plain str
+ROPE_TAIL_PARTS = 64  # pending appends joined into a single chunk at a time
+VIEW_MIN_LENGTH = 64  # substrings shorter than this are copied instead of viewed
+VIEW_COMPACT_MIN = 4096  # buffers at least this long ...
+VIEW_COMPACT_RATIO = 8  # ... are not kept alive by a stored view this many times shorter
+
+
+class NilType:
+    __slots__ = ()
+
+    def __str__(self):
+        return "nil"
+
+    def __repr__(self):
+        return "nil"
+
+
+NIL = NilType()
+
+
+# append buffer shared by every Rope built by extending the same string;
+# chunks + tail always spell out the first `length` characters
+class _RopeBuffer:
+    __slots__ = ("chunks", "tail", "length")
+
+    def __init__(self, text):
+        self.chunks = [text]
+        self.tail = []
+        self.length = len(text)
+
+    def append(self, text):
+        self.tail.append(text)
+        self.length += len(text)
+        if len(self.tail) >= ROPE_TAIL_PARTS:
+            self.chunks.append("".join(self.tail))
+            self.tail = []
+
+    def text(self):
+        if self.tail or len(self.chunks) > 1:
+            self.chunks = ["".join(self.chunks) + "".join(self.tail)]
+            self.tail = []
+        return self.chunks[0]
+
+
+# lazily concatenated Brewin string; a rope is a prefix of its buffer, and appending to the
+# rope that owns the whole buffer extends it in place, so `s = s + "x"` is amortised O(1)
+class Rope:
+    __slots__ = ("buffer", "length", "flat")
+
+    def __init__(self, buffer, length):
+        self.buffer = buffer
+        self.length = length
+        self.flat = None
+
+    def concat(self, other):
+        other = _text(other)
+        buffer = self.buffer
+        if buffer.length != self.length:
+            # an older version of the string; branch off a buffer of our own
+            buffer = _RopeBuffer(self.flatten())
+        buffer.append(other)
+        return Rope(buffer, buffer.length)
+
+    def flatten(self):
+        if self.flat is None:
+            text = self.buffer.text()
+            self.flat = text if len(text) == self.length else text[: self.length]
+        return self.flat
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.flatten()
+
+    def __hash__(self):
+        return hash(self.flatten())
+
+    def __eq__(self, other):
+        return self.flatten() == _text(other)
+
+    def __ne__(self, other):
+        return self.flatten() != _text(other)
+
+    def __lt__(self, other):
+        return self.flatten() < _text(other)
+
+    def __le__(self, other):
+        return self.flatten() <= _text(other)
+
+    def __gt__(self, other):
+        return self.flatten() > _text(other)
+
+    def __ge__(self, other):
+        return self.flatten() >= _text(other)
+
+
+# zero-copy substring: `length` characters of the str `buffer` from `start`. Views compare
+# and search in place and are only copied out when their text itself is needed
+class StringView:
+    __slots__ = ("buffer", "start", "length")
+
+    def __init__(self, buffer, start, length):
+        self.buffer = buffer
+        self.start = start
+        self.length = length
+
+    def flatten(self):
+        return self.buffer[self.start : self.start + self.length]
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.flatten()
+
+    def __hash__(self):
+        return hash(self.flatten())
+
+    def __eq__(self, other):
+        other = _text(other)
+        return len(other) == self.length and self.buffer.startswith(other, self.start)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        return self.flatten() < _text(other)
+
+    def __le__(self, other):
+        return self.flatten() <= _text(other)
+
+    def __gt__(self, other):
+        return self.flatten() > _text(other)
+
+    def __ge__(self, other):
+        return self.flatten() >= _text(other)
+
+
+def _text(value):
+    if type(value) is Rope or type(value) is StringView:
+        return value.flatten()
+    return value
+
+
+# the str a string value is a slice of, and the slice's start
+def _span(value):
+    if type(value) is StringView:
+        return value.buffer, value.start
+    return _text(value), 0
+
+
+# characters start .. end - 1 of a string value (bounds already checked); long results are views
+def substring(value, start, end):
+    buffer, offset = _span(value)
+    if end - start < VIEW_MIN_LENGTH:
+        return buffer[offset + start : offset + end]
+    return StringView(buffer, offset + start, end - start)
+
+
+# index of needle in a string value at or after start, or -1
+def find(value, needle, start):
+    buffer, offset = _span(value)
+    index = buffer.find(_text(needle), offset + start, offset + len(value))
+    return index if index < 0 else index - offset
+
+
+# the value to store for a StringView: a copy if the view would keep a much larger buffer alive
+def compact(view):
+    if len(view.buffer) >= VIEW_COMPACT_MIN and view.length * VIEW_COMPACT_RATIO < len(view.buffer):
+        return view.flatten()
+    return view
+
+
+# Brewin string '+'; short results stay plain strs, longer ones become ropes
+def concat(left, right):
+    if type(left) is Rope:
+        return left.concat(right)
+    if type(left) is StringView:
+        left = left.flatten()
+    if type(right) is not str:
+        right = right.flatten()
+    if len(left) + len(right) < ROPE_MIN_LENGTH:
+        return left + right
+    buffer = _RopeBuffer(left)
+    buffer.append(right)
+    return Rope(buffer, buffer.length)
+
+
+STRING_TYPES = (str, Rope, StringView)
+
+
+# whether two values have the same Brewin type; str, Rope and StringView are all strings
+def same_type(left, right):
+    return type(left) is type(right) or (type(left) in STRING_TYPES and type(right) in STRING_TYPES)
+
+
+# bytes given back by containers freed during a run; the interpreter takes them off its
+# memory count the next time it charges memory. Each run has its own. A container may be
+# freed on any thread, or by the cycle collector in the middle of take, so freed sizes are
+# queued in a deque (whose append and popleft are atomic) rather than added to a total
+class FreedMemory:
+    __slots__ = ("sizes",)
+
+    def __init__(self):
+        self.sizes = deque()
+
+    def add(self, size):
+        self.sizes.append(size)
+
+    # the bytes freed since the last take
+    def take(self):
+        total = 0
+        sizes = self.sizes
+        while sizes:
+            total += sizes.popleft()
+        return total
+
+
+# compiled form of a struct definition: field name -> slot index, the declared type of
+# each slot (a tuple of Python types, or the StructLayout of a struct-typed field), a
+# template holding every field's default value, and the bytes a new instance is charged for
+class StructLayout:
+    __slots__ = ("name", "field_index", "field_types", "template", "size", "freed")
+
+    def __init__(self, name, field_names, freed=None):
+        self.name = name
+        self.field_index = {field_name: index for index, field_name in enumerate(field_names)}
+        self.field_types = ()
+        self.template = []
+        self.size = 0
+        self.freed = FreedMemory() if freed is None else freed
+
+    def instantiate(self):
+        return Struct(self, self.template.copy(), self.size)
+
+
+# a struct instance; fields are stored by slot index in layout order. size is the bytes the
+# instance and its field values are charged for, given back when it is freed
+class Struct:
+    __slots__ = ("layout", "fields", "size")
+
+    def __init__(self, layout, fields, size=0):
+        self.layout = layout
+        self.fields = fields
+        self.size = size
+
+    def __del__(self):
+        self.layout.freed.add(self.size)
+
+    def __str__(self):
+        return self.layout.name
+
+
+# fixed-length array of 64-bit signed ints, created and accessed through builtins;
+# items is an array('q'). size is the bytes the array is charged for, given back to
+# `freed` when it is freed
+class IntArray:
+    __slots__ = ("items", "size", "freed")
+
+    def __init__(self, items, freed=None):
+        self.items = items
+        self.size = IntArray.__basicsize__ + sys.getsizeof(items)
+        self.freed = FreedMemory() if freed is None else freed
+
+    def __del__(self):
+        self.freed.add(self.size)
+
+    def __str__(self):
+        return "[" + ", ".join(map(str, self.items)) + "]"
+
+
+# an IntArray holding `length` copies of value
+def new_int_array(length, value=0, freed=None):
+    return IntArray(array("q", (value,)) * length, freed)
+
+
+# dict-backed map from int, bool and string keys to any value, created and accessed through
+# builtins; keys are stored as map_key encodes them. size is the bytes the map and its
+# entries are charged for, given back to `freed` when it is freed
+class BrewinMap:
+    __slots__ = ("items", "size", "freed")
+
+    def __init__(self, freed=None):
+        self.items = {}
+        self.size = MAP_SIZE
+        self.freed = FreedMemory() if freed is None else freed
+
+    def __del__(self):
+        self.freed.add(self.size)
+
+    def __str__(self):
+        return "{" + ", ".join(
+            format_value(key_value(key)) + ": " + format_value(value) for key, value in self.items.items()
+        ) + "}"
+
+
+# the dict key for a Brewin value, or None if it can't be a map key. Ropes are flattened so
+# equal strings hash alike, and bools are wrapped so true and 1 stay distinct keys
+def map_key(value):
+    if type(value) is int or type(value) is str:
+        return value
+    if type(value) is Rope or type(value) is StringView:
+        return value.flatten()
+    if type(value) is bool:
+        return (bool, value)
+    return None
+
+
+def key_value(key):
+    if type(key) is tuple:
+        return key[1]
+    return key
+
+
+# values compared by identity rather than by contents
+REFERENCE_TYPES = (NilType, Struct, IntArray, BrewinMap)
+
+PRIMITIVE_TYPES = {
+    "int": (int,), "bool": (bool,), "string": STRING_TYPES,
+    "array": (IntArray, NilType), "map": (BrewinMap, NilType),
+}
+PRIMITIVE_DEFAULTS = {"int": 0, "bool": False, "string": "", "array": NIL, "map": NIL}
+
+
+# whether value may be stored where declared_type (a field_types entry) is expected
+def matches_type(value, declared_type):
+    if type(declared_type) is StructLayout:
+        return value is NIL or (type(value) is Struct and value.layout is declared_type)
+    return type(value) in declared_type
+
+
+BOOL_TEXT = {True: "true", False: "false"}
+
+# value type -> function giving the value's printed text
+FORMATTERS = {
+    int: int.__repr__,
+    bool: BOOL_TEXT.__getitem__,
+    str: str,
+    Rope: Rope.flatten,
+    StringView: StringView.flatten,
+    NilType: NilType.__str__,
+    Struct: Struct.__str__,
+    IntArray: IntArray.__str__,
+    BrewinMap: BrewinMap.__str__,
+}
+
+
+# a value as Brewin prints it
+def format_value(value):
+    return FORMATTERS[type(value)](value)
+
+
+EMPTY_STRING_SIZE = sys.getsizeof("")
+
+
+# bytes a stored value holds against the run's memory quota; only strings are charged per
+# reference. Structs, arrays and maps are shared by reference and charged once for
+# themselves (see Struct.size, IntArray.size and BrewinMap.size)
+def value_size(value):
+    if type(value) is str:
+        return sys.getsizeof(value)
+    if type(value) is Rope or type(value) is StringView:
+        return EMPTY_STRING_SIZE + len(value)
+    return 0
+
+
+MAP_SIZE = BrewinMap.__basicsize__ + sys.getsizeof({})
+MAP_ENTRY_SIZE = 3 * 8  # a dict entry's hash, key and value
+
+
+# bytes a map entry is charged for; key is the stored map_key
+def entry_size(key, value):
+    return MAP_ENTRY_SIZE + value_size(key) + value_size(value)
+
+
+# bytes a new struct instance holding `fields` is charged for
+def struct_size(fields):
+    return Struct.__basicsize__ + sys.getsizeof(fields) + sum(map(value_size, fields))
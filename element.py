@@ -1,14 +1,23 @@
+# AST nodes. Each node kind (and each binary operator) has its own class that keeps its
+# fields in __slots__ and its elem_type on the class; `dict` and `get` remain for code
+# written against the original dict-backed Element.
+from intbase import InterpreterBase
+
+
 class Element:
-    def __init__(self, elem_type, **kwargs):
-        self.elem_type = elem_type
-        self.dict = {}
-        for key, value in kwargs.items():
-            self.dict[key] = value
+    __slots__ = ("line_num",)
+    elem_type = None
+    field_names = ()
+    cache_names = ()  # mutable per-site runtime state, each starting as an empty list
 
     def get(self, key):
-        if key not in self.dict:
+        if key not in self.field_names:
             return None
-        return self.dict[key]
+        return getattr(self, key)
+
+    @property
+    def dict(self):
+        return {key: getattr(self, key) for key in self.field_names}
 
     def __str__(self):
         s = f"{self.elem_type}: "
@@ -19,7 +28,7 @@ class Element:
     def __val(self, v):
         if isinstance(v, Element):
             return "[" + str(v) + "]"
-        if isinstance(v, list):
+        if isinstance(v, (list, tuple)):
             s = ""
             for i in v:
                 s += str(i) + ", "
@@ -27,3 +36,380 @@ class Element:
                 return "[" + s[0:-2] + "]"
             return "[" + s + "]"
         return str(v)
+
+
+class ProgramNode(Element):
+    __slots__ = ("structs", "functions")
+    elem_type = InterpreterBase.PROGRAM_NODE
+    field_names = __slots__
+
+    def __init__(self, structs, functions):
+        self.line_num = None
+        self.structs = structs
+        self.functions = functions
+
+
+class StructNode(Element):
+    __slots__ = ("name", "fields")
+    elem_type = InterpreterBase.STRUCT_NODE
+    field_names = __slots__
+
+    def __init__(self, name, fields):
+        self.line_num = None
+        self.name = name
+        self.fields = fields
+
+
+class FieldDefNode(Element):
+    __slots__ = ("name", "var_type")
+    elem_type = InterpreterBase.FIELD_DEF_NODE
+    field_names = __slots__
+
+    def __init__(self, name, var_type):
+        self.line_num = None
+        self.name = name
+        self.var_type = var_type
+
+
+class FuncNode(Element):
+    __slots__ = ("name", "args", "return_type", "statements")
+    elem_type = InterpreterBase.FUNC_NODE
+    field_names = __slots__
+
+    def __init__(self, name, args, return_type, statements):
+        self.line_num = None
+        self.name = name
+        self.args = args
+        self.return_type = return_type
+        self.statements = statements
+
+
+class ArgNode(Element):
+    __slots__ = ("name", "var_type")
+    elem_type = InterpreterBase.ARG_NODE
+    field_names = __slots__
+
+    def __init__(self, name, var_type):
+        self.line_num = None
+        self.name = name
+        self.var_type = var_type
+
+
+class VarDefNode(Element):
+    __slots__ = ("name", "var_type")
+    elem_type = InterpreterBase.VAR_DEF_NODE
+    field_names = __slots__
+
+    def __init__(self, name, var_type):
+        self.line_num = None
+        self.name = name
+        self.var_type = var_type
+
+
+class AssignNode(Element):
+    __slots__ = ("name", "expression")
+    elem_type = "="
+    field_names = __slots__
+
+    def __init__(self, name, expression):
+        self.line_num = None
+        self.name = name
+        self.expression = expression
+
+
+# assignment through a field path, `a.b.c = expression`
+class FieldAssignNode(Element):
+    __slots__ = ("path", "expression")
+    elem_type = "="
+    field_names = __slots__
+
+    def __init__(self, path, expression):
+        self.line_num = None
+        self.path = path
+        self.expression = expression
+
+
+class IfNode(Element):
+    __slots__ = ("condition", "statements", "else_statements")
+    elem_type = InterpreterBase.IF_NODE
+    field_names = __slots__
+
+    def __init__(self, condition, statements, else_statements):
+        self.line_num = None
+        self.condition = condition
+        self.statements = statements
+        self.else_statements = else_statements
+
+
+class ForNode(Element):
+    __slots__ = ("init", "condition", "update", "statements")
+    elem_type = InterpreterBase.FOR_NODE
+    field_names = __slots__
+
+    def __init__(self, init, condition, update, statements):
+        self.line_num = None
+        self.init = init
+        self.condition = condition
+        self.update = update
+        self.statements = statements
+
+
+# `plan` is the interpreter's per-node setup for entering the try and its catch table (see
+# Interpreter.try_plan), and not part of the tree
+class TryNode(Element):
+    __slots__ = ("statements", "catchers", "plan")
+    elem_type = InterpreterBase.TRY_NODE
+    field_names = ("statements", "catchers")
+    cache_names = ("plan",)
+
+    def __init__(self, statements, catchers):
+        self.line_num = None
+        self.statements = statements
+        self.catchers = catchers
+        self.plan = []
+
+
+class CatchNode(Element):
+    __slots__ = ("exception_type", "statements")
+    elem_type = InterpreterBase.CATCH_NODE
+    field_names = __slots__
+
+    def __init__(self, exception_type, statements):
+        self.line_num = None
+        self.exception_type = exception_type
+        self.statements = statements
+
+
+class RaiseNode(Element):
+    __slots__ = ("exception_type",)
+    elem_type = InterpreterBase.RAISE_NODE
+    field_names = __slots__
+
+    def __init__(self, exception_type):
+        self.line_num = None
+        self.exception_type = exception_type
+
+
+class ReturnNode(Element):
+    __slots__ = ("expression",)
+    elem_type = InterpreterBase.RETURN_NODE
+    field_names = __slots__
+
+    def __init__(self, expression):
+        self.line_num = None
+        self.expression = expression
+
+
+class UnaryOpNode(Element):
+    __slots__ = ("op1",)
+    field_names = __slots__
+
+    def __init__(self, op1):
+        self.line_num = None
+        self.op1 = op1
+
+
+class NotNode(UnaryOpNode):
+    __slots__ = ()
+    elem_type = InterpreterBase.NOT_NODE
+
+
+class NegNode(UnaryOpNode):
+    __slots__ = ()
+    elem_type = InterpreterBase.NEG_NODE
+
+
+class BinaryOpNode(Element):
+    __slots__ = ("op1", "op2")
+    field_names = __slots__
+
+    def __init__(self, op1, op2):
+        self.line_num = None
+        self.op1 = op1
+        self.op2 = op2
+
+
+class AddNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "+"
+
+
+class SubtractNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "-"
+
+
+class MultiplyNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "*"
+
+
+class DivideNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "/"
+
+
+class EqualNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "=="
+
+
+class NotEqualNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "!="
+
+
+class LessNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "<"
+
+
+class LessEqualNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "<="
+
+
+class GreaterNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = ">"
+
+
+class GreaterEqualNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = ">="
+
+
+class AndNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "&&"
+
+
+class OrNode(BinaryOpNode):
+    __slots__ = ()
+    elem_type = "||"
+
+
+# operator token -> node class
+BINARY_OP_NODES = {
+    node_class.elem_type: node_class
+    for node_class in (
+        AddNode, SubtractNode, MultiplyNode, DivideNode, EqualNode, NotEqualNode,
+        LessNode, LessEqualNode, GreaterNode, GreaterEqualNode, AndNode, OrNode,
+    )
+}
+
+
+class NewNode(Element):
+    __slots__ = ("var_type",)
+    elem_type = InterpreterBase.NEW_NODE
+    field_names = __slots__
+
+    def __init__(self, var_type):
+        self.line_num = None
+        self.var_type = var_type
+
+
+class ValueNode(Element):
+    __slots__ = ("val",)
+    field_names = __slots__
+
+    def __init__(self, val):
+        self.line_num = None
+        self.val = val
+
+
+class IntNode(ValueNode):
+    __slots__ = ()
+    elem_type = InterpreterBase.INT_NODE
+
+
+class BoolNode(ValueNode):
+    __slots__ = ()
+    elem_type = InterpreterBase.BOOL_NODE
+
+
+class StringNode(ValueNode):
+    __slots__ = ()
+    elem_type = InterpreterBase.STRING_NODE
+
+
+class NilNode(Element):
+    __slots__ = ()
+    elem_type = InterpreterBase.NIL_NODE
+
+    def __init__(self):
+        self.line_num = None
+
+
+class VarNode(Element):
+    __slots__ = ("name",)
+    elem_type = InterpreterBase.VAR_NODE
+    field_names = __slots__
+
+    def __init__(self, name):
+        self.line_num = None
+        self.name = name
+
+
+# dotted access `a.b.c`: the base variable name and the tuple of field names after it;
+# `cache` is the interpreter's inline cache for this site and not part of the tree
+class FieldPathNode(Element):
+    __slots__ = ("base", "fields", "cache")
+    elem_type = "field_path"
+    field_names = ("base", "fields")
+    cache_names = ("cache",)
+
+    def __init__(self, base, fields):
+        self.line_num = None
+        self.base = base
+        self.fields = fields
+        self.cache = []
+
+
+# `site` is the interpreter's resolution of the called function and not part of the tree
+class FCallNode(Element):
+    __slots__ = ("name", "args", "site")
+    elem_type = InterpreterBase.FCALL_NODE
+    field_names = ("name", "args")
+    cache_names = ("site",)
+
+    def __init__(self, name, args):
+        self.line_num = None
+        self.name = name
+        self.args = args
+        self.site = []
+
+
+def _frozen_setattr(self, name, value):
+    raise AttributeError(f"{type(self).__name__} is immutable")
+
+
+_frozen_classes = {}
+
+
+# Immutable variant of a node class, used for hash-consed trees (see brewparse.share_subtrees).
+# Identical subtrees are one object, so identity equality and the identity hash are
+# structural.
+def frozen_class(node_class):
+    frozen = _frozen_classes.get(node_class)
+    if frozen is None:
+        frozen = type(
+            "Frozen" + node_class.__name__,
+            (node_class,),
+            {
+                "__slots__": (),
+                "__setattr__": _frozen_setattr,
+            },
+        )
+        _frozen_classes[node_class] = frozen
+    return frozen
+
+
+def make_frozen(node_class, line_num, fields):
+    node = object.__new__(frozen_class(node_class))
+    object.__setattr__(node, "line_num", line_num)
+    for key, value in fields.items():
+        object.__setattr__(node, key, value)
+    for key in node_class.cache_names:
+        object.__setattr__(node, key, [])
+    return node
@@ -1,14 +1,89 @@
 # Base class for our interpreter
 from enum import Enum
 
+from brewio import ConsoleLogSink
+
 
 class ErrorType(Enum):
     TYPE_ERROR = 1
     NAME_ERROR = 2  # if a variable or function name can't be found
     FAULT_ERROR = 3  # used if an object reference is null and used to make a call
+    STEP_LIMIT_ERROR = 4  # the program executed more steps than its budget allows
+    TIME_LIMIT_ERROR = 5  # the program ran past its wall-clock or CPU time limit
+    MEMORY_LIMIT_ERROR = 6  # values held by the program grew past its memory quota
+    DEPTH_LIMIT_ERROR = 7  # function calls nested deeper than the run allows
     # Add others here
 
 
+# Raised by InterpreterBase.error; one subclass per ErrorType. The node and line the error
+# refers to are kept as fields, and the message is only assembled when it is read: with
+# description_args, description is a str.format template filled in on first use.
+class BrewinError(Exception):
+    error_type = None
+
+    # Exception.__new__ already keeps the constructor arguments in args, so pickling
+    # rebuilds the error; Exception.__init__ is not needed
+    def __init__(self, description=None, line_num=None, node=None, description_args=(), function=None):
+        self.template = description
+        self.description_args = description_args
+        self.line_num = line_num
+        self.node = node
+        self.function = function  # the Brewin function running, for errors that report it
+
+    @property
+    def description(self):
+        if self.description_args:
+            self.template = self.template.format(*self.description_args)
+            self.description_args = ()
+        return self.template
+
+    def __str__(self):
+        if self.description:
+            description = ": " + self.description
+        else:
+            description = ""
+        if not self.line_num:
+            return f"{self.error_type}{description}"
+        return f"{self.error_type} on line {self.line_num}{description}"
+
+
+class BrewinTypeError(BrewinError):
+    error_type = ErrorType.TYPE_ERROR
+
+
+class BrewinNameError(BrewinError):
+    error_type = ErrorType.NAME_ERROR
+
+
+class BrewinFaultError(BrewinError):
+    error_type = ErrorType.FAULT_ERROR
+
+
+class BrewinStepLimitError(BrewinError):
+    error_type = ErrorType.STEP_LIMIT_ERROR
+
+
+class BrewinTimeLimitError(BrewinError):
+    error_type = ErrorType.TIME_LIMIT_ERROR
+
+
+class BrewinMemoryLimitError(BrewinError):
+    error_type = ErrorType.MEMORY_LIMIT_ERROR
+
+
+class BrewinDepthLimitError(BrewinError):
+    error_type = ErrorType.DEPTH_LIMIT_ERROR
+
+
+ERROR_CLASSES = {
+    error_class.error_type: error_class
+    for error_class in (
+        BrewinTypeError, BrewinNameError, BrewinFaultError, BrewinStepLimitError,
+        BrewinTimeLimitError, BrewinMemoryLimitError, BrewinDepthLimitError,
+    )
+}
+
+
 class InterpreterBase:
     # AST node types
     PROGRAM_NODE = "program"
@@ -40,14 +115,21 @@ class InterpreterBase:
     VOID_DEF = "void"
     
     # methods
-    def __init__(self, console_output=True, inp=None):
+    # output_sink receives every output line (see brewio); by default lines are printed if
+    # console_output is set and all of them are kept for get_output. input_provider, if given,
+    # supplies the input instead of inp (see brewio)
+    def __init__(self, console_output=True, inp=None, output_sink=None, input_provider=None):
         self.console_output = console_output
         self.inp = inp  # if not none, then read input from passed-in list
+        self.output_sink = ConsoleLogSink(console_output) if output_sink is None else output_sink
+        self.input_provider = input_provider
         self.reset()
 
     # Call to reset I/O for another run of the program
     def reset(self):
-        self.output_log = []
+        self.output_sink.reset()
+        if self.input_provider is not None:
+            self.input_provider.reset()
         self.input_cursor = 0
         self.error_type = None
         self.error_line = None
@@ -57,6 +139,10 @@ class InterpreterBase:
         pass
 
     def get_input(self):
+        if self.input_provider is not None:
+            value = self.input_provider.read()
+            self.input_cursor = self.input_provider.cursor
+            return value
         if not self.inp:
             return input()  # Get input from keyboard if not input list provided
 
@@ -66,27 +152,37 @@ class InterpreterBase:
             return cur_input
         return None
 
-    # students must call this for any errors that they run into
-    def error(self, error_type, description=None, line_num=None):
+    # the next input as an int, None once the input is exhausted; raises ValueError (having
+    # consumed the value) if it is not an integer
+    def get_int_input(self):
+        if self.input_provider is None:
+            text = self.get_input()
+            return None if text is None else int(text)
+        try:
+            return self.input_provider.read_int()
+        finally:
+            self.input_cursor = self.input_provider.cursor
+
+    # students must call this for any errors that they run into;
+    # without a line_num, the line comes from the AST node the error is about. With args,
+    # description is a str.format template, filled in only if the message is read
+    def error(self, error_type, description=None, line_num=None, node=None, args=(), function=None):
+        if line_num is None and node is not None:
+            line_num = node.line_num
         # log the error before we throw
         self.error_line = line_num
         self.error_type = error_type
-
-        if description:
-            description = ": " + description
-        else:
-            description = ""
-        if not line_num:
-            raise Exception(f"{error_type}{description}")
-        raise Exception(f"{error_type} on line {line_num}{description}")
+        raise ERROR_CLASSES[error_type](description, line_num, node, args, function)
 
     def output(self, v):
-        if self.console_output:
-            print(v)
-        self.output_log.append(v)
+        self.output_sink.write(v)
 
     def get_output(self):
-        return self.output_log
+        return self.output_sink.lines()
+
+    @property
+    def output_log(self):
+        return self.output_sink.lines()
 
     def get_error_type_and_line(self):
         return self.error_type, self.error_line
@@ -1,18 +1,73 @@
-from intbase import InterpreterBase, ErrorType
+import gc
+import math
+import queue
+import sys
+import threading
+import time
+
+from intbase import BrewinError, InterpreterBase, ErrorType
 from brewparse import parse_program
+from brewbuiltins import BUILTINS, builtin_print, lookup_builtin
+from brewenv import Environment, FramePool
+from brewvalues import (
+  NIL, PRIMITIVE_DEFAULTS, PRIMITIVE_TYPES, REFERENCE_TYPES, STRING_TYPES, FreedMemory, StringView, Struct,
+  StructLayout, compact, concat, format_value, matches_type, same_type, struct_size, value_size,
+)
+from element import (
+  AddNode, AndNode, AssignNode, BoolNode, DivideNode, Element, EqualNode, FCallNode,
+  FieldAssignNode, FieldPathNode, ForNode,
+  GreaterEqualNode, GreaterNode, IfNode, IntNode, LessEqualNode, LessNode, MultiplyNode, NegNode, NewNode,
+  NilNode, NotEqualNode, NotNode, OrNode, RaiseNode, ReturnNode, StringNode, SubtractNode, TryNode,
+  ValueNode, VarDefNode, VarNode,
+)
 
-def is_definition(statement_node):
-  if statement_node.elem_type == 'vardef':
-    return True
-  return False
+STREAM_POLL_INTERVAL = 0.05  # seconds a blocked producer waits before rechecking for cancellation
+POLL_INTERVAL_STEPS = 10000  # steps executed between polls of the run limits and cancellation flag
+FIELD_CACHE_LIMIT = 4  # struct layouts a field-access site caches before it falls back to lookups
+CALL_DEPTH_LIMIT = 1000  # nested Brewin calls a run allows unless it sets call_depth_limit
+PYTHON_FRAMES_PER_CALL = 50  # Python recursion depth set aside for each nested Brewin call
 
-def is_assignment(statement_node):
-  if statement_node.elem_type == '=':
-    return True
-  return False
+# raised inside the interpreter thread when an iter_run consumer goes away
+class RunCancelled(Exception):
+  pass
+
+# a Brewin `raise` unwinding to its handler; exception_type is the raised string
+class RaisedException(Exception):
+  def __init__(self, exception_type, node):
+    self.exception_type = exception_type
+    self.node = node
+
+# marks the end of an iter_run stream; carries the error (if any) that ended the run
+class _StreamEnd:
+  def __init__(self, error=None):
+    self.error = error
+
+# output sink of an iter_run: hands each line to the consumer's queue, waiting while it is full
+class _QueueSink:
+  def __init__(self, interpreter, lines):
+    self.interpreter = interpreter
+    self.queue = lines
+
+  def write(self, line):
+    while not self.interpreter.stop_requested:
+      try:
+        self.queue.put(line, timeout=STREAM_POLL_INTERVAL)
+        return
+      except queue.Full:
+        pass
+    raise RunCancelled()
 
-def is_func_call(statement_node):
-  if statement_node.elem_type == 'fcall':
+  def flush(self):
+    pass
+
+  def lines(self):
+    return []
+
+  def reset(self):
+    pass
+
+def is_definition(statement_node):
+  if statement_node.elem_type == 'vardef':
     return True
   return False
 
@@ -26,25 +81,199 @@ def is_for(statement_node):
     return True
   return False
 
-def is_return(statement_node):
-  if statement_node.elem_type == 'return':
+def is_try(statement_node):
+  if statement_node.elem_type == 'try':
     return True
   return False
 
+# number of AST nodes evaluated when the statement itself runs; nested blocks are charged separately
+def statement_cost(statement_node):
+  if is_if(statement_node):
+    return 1 + node_count(statement_node.condition)
+  if is_for(statement_node):
+    return 1 + node_count(statement_node.init) + node_count(statement_node.condition)
+  if is_try(statement_node):
+    return 1
+  return node_count(statement_node)
+
+def node_count(node):
+  count = 1
+  for key in node.field_names:
+    value = getattr(node, key)
+    if isinstance(value, Element):
+      count += node_count(value)
+    elif isinstance(value, (list, tuple)):
+      for item in value:
+        if isinstance(item, Element):
+          count += node_count(item)
+  return count
+
+# number of variables a function body can define, i.e. the slots its frame needs
+def count_definitions(statements):
+  count = 0
+  for statement in statements:
+    if is_definition(statement):
+      count += 1
+    elif is_if(statement):
+      count += count_definitions(statement.statements)
+      if statement.else_statements != None:
+        count += count_definitions(statement.else_statements)
+    elif is_for(statement):
+      count += count_definitions(statement.statements)
+    elif is_try(statement):
+      count += count_definitions(statement.statements)
+      for catcher in statement.catchers:
+        count += count_definitions(catcher.statements)
+  return count
+
+# inline cache entry for a field path starting at a struct of `layout`: (layout, slot index
+# of each field, the slots of all but the last field, the last slot, the last field's declared
+# type); None if the declared field types don't determine every step
+def resolve_field_path(layout, field_names):
+  slots = []
+  current = layout
+  for field_name in field_names:
+    if type(current) is not StructLayout:
+      return None
+    index = current.field_index.get(field_name)
+    if index is None:
+      return None
+    slots.append(index)
+    current = current.field_types[index]
+  slots = tuple(slots)
+  return (layout, slots, slots[:-1], slots[-1], current)
+
 class Interpreter(InterpreterBase):
-  def __init__(self, console_output=True, inp=None, trace_output=False):
-    super().__init__(console_output, inp)
+  def __init__(self, console_output=True, inp=None, trace_output=False, output_sink=None, input_provider=None):
+    super().__init__(console_output, inp, output_sink, input_provider)
+    self.stop_requested = False
+    self.console_input_allowed = True
+    self.builtins = dict(BUILTINS)
+
+  # adds a native builtin for this interpreter; see brewbuiltins for the calling convention
+  def register_builtin(self, name, arity, function):
+    self.builtins[(name, arity)] = function
 
-  def run(self, program):
+  # runs program on a worker thread and yields each output line as soon as it is produced;
+  # max_pending bounds how many lines may wait for the consumer (None = unbounded);
+  # run_options are passed through to run(). Input must come from inp or an input provider:
+  # a worker waiting on the console could not be stopped when the stream is abandoned, so
+  # reading console input is a FAULT_ERROR
+  def iter_run(self, program, max_pending=None, **run_options):
+    lines = queue.Queue(max_pending or 0)
+    self.stop_requested = False
+    self.console_input_allowed = False
+    output_sink = self.output_sink
+    self.output_sink = _QueueSink(self, lines)
+
+    def produce():
+      try:
+        self.run(program, **run_options)
+        end = _StreamEnd()
+      except RunCancelled:
+        return
+      except Exception as e:
+        end = _StreamEnd(e)
+      while not self.stop_requested:
+        try:
+          lines.put(end, timeout=STREAM_POLL_INTERVAL)
+          return
+        except queue.Full:
+          pass
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+      while True:
+        line = lines.get()
+        if isinstance(line, _StreamEnd):
+          if line.error is not None:
+            raise line.error
+          return
+        yield line
+    finally:
+      self.stop_requested = True
+      worker.join()
+      self.stop_requested = False  # the worker is gone; later runs must not see the cancellation
+      self.console_input_allowed = True
+      self.output_sink = output_sink
+
+  # slow path of the step meter, reached once every POLL_INTERVAL_STEPS steps or when the budget runs out
+  def check_limits(self, node):
+    if self.stop_requested:
+      raise RunCancelled()
+    if self.steps > self.step_limit:
+      super().error(
+        ErrorType.STEP_LIMIT_ERROR,
+        "Program exceeded its budget of {} steps in function {}",
+        node=node,
+        args=(self.step_limit, self.current_func),
+        function=self.current_func,
+      )
+    if self.time_deadline is not None and time.monotonic() > self.time_deadline:
+      super().error(
+        ErrorType.TIME_LIMIT_ERROR,
+        "Program exceeded its time limit of {}s in function {}",
+        node=node,
+        args=(self.time_limit, self.current_func),
+        function=self.current_func,
+      )
+    if self.cpu_deadline is not None and time.process_time() > self.cpu_deadline:
+      super().error(
+        ErrorType.TIME_LIMIT_ERROR,
+        "Program exceeded its CPU time limit of {}s in function {}",
+        node=node,
+        args=(self.cpu_time_limit, self.current_func),
+        function=self.current_func,
+      )
+    self.next_check = min(self.steps + POLL_INTERVAL_STEPS, self.step_limit + 1)
+
+  # statements and expression nodes run by one pass over a block, excluding nested blocks
+  def block_cost(self, statements):
+    cost = self.cost_cache.get(id(statements))
+    if cost is None:
+      cost = sum(statement_cost(statement) for statement in statements)
+      self.cost_cache[id(statements)] = cost
+    return cost
+
+  # cost of one for-loop iteration: the body, the update and the condition re-check
+  def iteration_cost(self, for_node):
+    cost = self.cost_cache.get(id(for_node))
+    if cost is None:
+      cost = (self.block_cost(for_node.statements) + node_count(for_node.update)
+              + node_count(for_node.condition))
+      self.cost_cache[id(for_node)] = cost
+    return cost
+
+  # time_limit and cpu_time_limit are in seconds and polled together with the step budget;
+  # memory_limit caps the bytes held by strings in variables and by structs, arrays and maps;
+  # call_depth_limit caps how deeply calls nest (CALL_DEPTH_LIMIT if not given)
+  def run(self, program, step_limit=None, time_limit=None, cpu_time_limit=None, memory_limit=None,
+          call_depth_limit=None):
     ast = parse_program(program)
-    self.variable_list = []
+    self.call_depth_limit = CALL_DEPTH_LIMIT if call_depth_limit is None else call_depth_limit
+    self.call_depth = 0
+    self.memory_limit = math.inf if memory_limit is None else memory_limit
+    self.memory_used = 0
+    self.peak_memory = 0
+    self.freed_memory = FreedMemory()
+    self.steps = 0
+    self.step_limit = math.inf if step_limit is None else step_limit
+    self.next_check = 0
+    self.time_limit = time_limit
+    self.cpu_time_limit = cpu_time_limit
+    self.time_deadline = None if time_limit is None else time.monotonic() + time_limit
+    self.cpu_deadline = None if cpu_time_limit is None else time.process_time() + cpu_time_limit
+    self.current_func = 'main'
+    self.return_value = NIL
+    self.cost_cache = dict()
     self.func_list = dict()
-    self.variable_name_to_value = dict()  # dict to hold variables
-    self.var_to_type = dict()
-    functions = ast.dict['functions']
+    self.env = Environment()  # variables of the running function; values carry their own types
+    self.declare_structs(ast.structs)
+    functions = ast.functions
     exist_main = False
     for function in functions:
-      if function.dict['name'] == 'main':
+      if function.name == 'main':
         exist_main = True
         main_func_node = function
       else:
@@ -54,265 +283,760 @@ class Interpreter(InterpreterBase):
         ErrorType.NAME_ERROR,
         "No main() function was found",
       )
-    self.run_func(main_func_node)
+    # each Brewin call nests several Python calls; the recursion limit is raised for the run
+    # so the call depth limit, not Python's, is what a deep program runs into
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, (self.call_depth_limit + 1) * PYTHON_FRAMES_PER_CALL))
+    try:
+      self.run_func(main_func_node)
+    except RaisedException as e:
+      super().error(
+        ErrorType.FAULT_ERROR,
+        "Uncaught exception {}",
+        node=e.node,
+        args=(e.exception_type,),
+      )
+    except RecursionError:
+      # deeply nested blocks or expressions can still exhaust Python's stack
+      super().error(
+        ErrorType.DEPTH_LIMIT_ERROR,
+        "Program nested too deeply in function {}",
+        args=(self.current_func,),
+        function=self.current_func,
+      )
+    finally:
+      sys.setrecursionlimit(recursion_limit)
+      self.output_sink.flush()
+
+  # compiles every struct definition into a StructLayout; field types may name any struct,
+  # including ones defined later and the struct itself
+  def declare_structs(self, struct_nodes):
+    self.struct_layouts = dict()
+    for struct_node in struct_nodes:
+      if struct_node.name in self.struct_layouts or struct_node.name in PRIMITIVE_TYPES:
+        super().error(
+          ErrorType.NAME_ERROR,
+          "Struct {} defined more than once",
+          node=struct_node,
+          args=(struct_node.name,),
+        )
+      field_names = [field.name for field in struct_node.fields]
+      if len(set(field_names)) != len(field_names):
+        super().error(
+          ErrorType.NAME_ERROR,
+          "Struct {} has duplicate field names",
+          node=struct_node,
+          args=(struct_node.name,),
+        )
+      self.struct_layouts[struct_node.name] = StructLayout(struct_node.name, field_names, self.freed_memory)
+    for struct_node in struct_nodes:
+      layout = self.struct_layouts[struct_node.name]
+      field_types = []
+      for field in struct_node.fields:
+        if field.var_type in PRIMITIVE_TYPES:
+          field_types.append(PRIMITIVE_TYPES[field.var_type])
+        elif field.var_type in self.struct_layouts:
+          field_types.append(self.struct_layouts[field.var_type])
+        else:
+          super().error(
+            ErrorType.TYPE_ERROR,
+            "Unknown type {} for field {} of struct {}",
+            node=field,
+            args=(field.var_type, field.name, struct_node.name),
+          )
+        layout.template.append(self.default_value(field.var_type, field))
+      layout.field_types = tuple(field_types)
+      layout.size = struct_size(layout.template)
+
+  # initial value of a variable or field of the declared type; untyped variables start at 0
+  def default_value(self, var_type, node):
+    if var_type is None:
+      return 0
+    if var_type in PRIMITIVE_DEFAULTS:
+      return PRIMITIVE_DEFAULTS[var_type]
+    if var_type in self.struct_layouts:
+      return NIL
+    super().error(
+      ErrorType.TYPE_ERROR,
+      "Unknown type {}",
+      node=node,
+      args=(var_type,),
+    )
+
+  # what a value stored in a variable of the declared type must match (see matches_type):
+  # a tuple of Python types or a StructLayout; None for an untyped variable
+  def declared_type(self, var_type, node):
+    if var_type is None:
+      return None
+    if var_type in PRIMITIVE_TYPES:
+      return PRIMITIVE_TYPES[var_type]
+    layout = self.struct_layouts.get(var_type)
+    if layout is None:
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Unknown type {}",
+        node=node,
+        args=(var_type,),
+      )
+    return layout
 
   def declare_func(self, func_node):
-    func_name = func_node.dict['name']
-    args_list = func_node.dict['args']
+    func_name = func_node.name
+    args_list = func_node.args
     if func_name in self.func_list.keys() and len(args_list) == len(self.func_list[func_name][0]):
       super().error(
         ErrorType.TYPE_ERROR,
         "Undistinguishable function declaration",
+        node=func_node,
       )
     arg_names = []
+    arg_types = []
     for arg in args_list:
       arg_name = self.extract_argname(arg)
       arg_names.append(arg_name)
-    statements = func_node.dict['statements']
-    self.func_list[(func_name, len(arg_names))] = (arg_names, statements)
+      arg_types.append(self.declared_type(arg.var_type, arg))
+    statements = func_node.statements
+    frame_pool = FramePool(len(arg_names) + count_definitions(statements))
+    self.func_list[(func_name, len(arg_names))] = (arg_names, statements, arg_types, frame_pool)
     
     
     # pass
   
   def run_func(self, func_node):
-    statements = func_node.dict['statements']
-    print(self.func_list)
-    for statement_node in statements:
-      self.run_statement(statement_node)
+    statements = func_node.statements
+    self.steps += self.block_cost(statements)
+    self.check_limits(func_node)
+    self.run_block(statements)
 
   def extract_argname(self, arg_node):
-    return arg_node.dict['name']
-  
-  def run_statement(self, statement_node):
-    if is_definition(statement_node):
-      var_name = statement_node.dict['name']
-      # TODO: Type null ? 
-      if statement_node.dict['name'] in self.variable_list:
-        super().error(
-          ErrorType.NAME_ERROR,
-          f"Variable {var_name} defined more than once",
-        )
-        return
-      else:
-        self.variable_list.append(var_name)
-        self.variable_name_to_value[var_name] = 0 # set the initial value to 0 by default
-        self.var_to_type[var_name] = "int"
-
-    elif is_assignment(statement_node):
-      self.do_assignment(statement_node)
-
-    elif is_func_call(statement_node):
-      func_name = statement_node.dict['name']
-      passin_args_list = statement_node.dict['args']
-      num_passins = len(passin_args_list)
-      if func_name == 'print':
-        output = ''
-        for arg in passin_args_list:
-          result = self.evaluate_expression(arg)[0]
-          output+=str(result)
-        super().output(output)
-
-      elif (func_name, num_passins) not in self.func_list:
-        super().error(
-          ErrorType.NAME_ERROR,
-          f"Function {func_name} with {num_passins} arguments was not found",
-        )
+    return arg_node.name
 
-      elif func_name == "inputi":
-        # TODO: inputi function
-        pass
-      else: 
-
-        func_args_list = self.func_list[(func_name, num_passins)][0]
-        func_body = self.func_list[(func_name, num_passins)][1]
-        for decl_arg, passin in zip(func_args_list, passin_args_list):
-          self.variable_list.append(decl_arg)
-          resulting_value = self.evaluate_expression(passin)[0]
-          resulting_type = self.evaluate_expression(passin)[1]
-          self.variable_name_to_value[decl_arg] = resulting_value
-          self.var_to_type[decl_arg] = resulting_type
-        for statement in func_body:
-          self.run_statement(statement)
-
-
-
-    elif is_if(statement_node):
-      condition = statement_node.dict['condition']
-      if_statements = statement_node.dict['statements']
-      else_statements = statement_node.dict['else_statements']
-      if self.evaluate_expression(condition)[1] != "bool":
-        super().error(
-          ErrorType.TYPE_ERROR,
-          f"Condition of the if statement does not evaluate to a boolean",
-        )
-      else:
-        if self.evaluate_expression(condition)[0]:
-          for statement in if_statements:
-            self.run_statement(statement)
-        elif else_statements != None:
-          for statement in else_statements:
-            self.run_statement(statement)
-
-    elif is_for(statement_node):
-      init = statement_node.dict['init']
-      loop_cond = statement_node.dict['condition']
-      update = statement_node.dict['update']
-      loop_body = statement_node.dict['statements']
-      if self.evaluate_expression(loop_cond)[1] != "bool":
-        super().error(
-          ErrorType.TYPE_ERROR,
-          f"Terminating condition of the for statement does not evaluate to a boolean",
-        )
-      self.do_assignment(init)
-      while (self.evaluate_expression(loop_cond)[0]):
-        for statement in loop_body:
-          self.run_statement(statement)
-        self.run_statement(update)
-    elif is_return(statement_node):
-      pass
+  # runs statements in order; returns True if a return statement ended the block early.
+  # Expressions of a hash-consed tree have no line of their own (see
+  # brewparse.share_subtrees): an error or raise in one takes the line of its statement
+  def run_block(self, statements):
+    try:
+      for statement in statements:
+        if self.run_statement(statement):
+          return True
+      return False
+    except BrewinError as e:
+      if e.line_num is None:
+        e.line_num = self.error_line = statement.line_num
+      raise
+    except RaisedException as e:
+      if e.node.line_num is None:
+        e.node = statement
+      raise
 
-  def do_assignment(self, statement_node):
-    var_name = statement_node.dict['name'] 
-    if var_name not in self.variable_list:
+  # runs statements in a nested scope of the current environment
+  def run_scoped_block(self, statements):
+    self.env.push_scope()
+    returned = self.run_block(statements)
+    self.memory_used -= self.env.pop_scope()
+    return returned
+
+  # calls the function a call site names; the site is resolved on its first call
+  def call_function(self, call_node):
+    site = call_node.site
+    if not site:
+      self.resolve_call(call_node)
+    return site[0](self, call_node, site[1])
+
+  # user functions shadow builtins of the same name and arity
+  def resolve_call(self, call_node):
+    func_name = call_node.name
+    num_passins = len(call_node.args)
+    function = self.func_list.get((func_name, num_passins))
+    if function is not None:
+      call_node.site.extend((Interpreter.call_user_function, function))
+      return
+    function = lookup_builtin(self.builtins, func_name, num_passins)
+    if function is None:
       super().error(
         ErrorType.NAME_ERROR,
-        f"Variable {var_name} has not been defined",
+        "Function {} with {} arguments was not found",
+        node=call_node,
+        args=(func_name, num_passins),
       )
+    # a print of literals always prints the same line, so the site keeps the text
+    if function is builtin_print and all(isinstance(arg, (ValueNode, NilNode)) for arg in call_node.args):
+      text = "".join(format_value(self.evaluate_expression(arg)) for arg in call_node.args)
+      call_node.site.extend((Interpreter.print_text, text))
       return
-    source_node = statement_node.dict['expression']
-    resulting_value = self.evaluate_expression(source_node)[0]
-    resulting_type = self.evaluate_expression(source_node)[1]
-    self.variable_name_to_value[var_name] = resulting_value
-    self.var_to_type[var_name] = resulting_type
+    call_node.site.extend((Interpreter.call_builtin, function))
 
-  def evaluate_expression(self, expression_node):
-    node_type = expression_node.elem_type
-    node_dict = expression_node.dict
-    if node_type == 'int':
-        # print(node_dict['val'], "int")
-        return node_dict['val'], "int"
-    elif node_type == 'string':
-        # print(node_dict['val'], "string")
-        return node_dict['val'], "string"
-    elif node_type == 'bool':
-        # print(node_dict['val'], "bool")
-        return node_dict['val'], "bool"
-    elif node_type == 'nil':
-        return 'nil', "nil"
-    
-    elif node_type == 'var':
-        var_name = node_dict['name']
-        if var_name not in self.variable_list:
+  def print_text(self, call_node, text):
+    self.output(text)
+    return NIL
+
+  def call_builtin(self, call_node, function):
+    return function(self, call_node, *map(self.evaluate_expression, call_node.args))
+
+  def call_user_function(self, call_node, function):
+    func_name = call_node.name
+    passin_args_list = call_node.args
+    func_args_list, func_body, func_arg_types, frame_pool = function
+    self.steps += self.block_cost(func_body)
+    if self.steps >= self.next_check:
+      self.check_limits(call_node)
+    caller_env, caller, depth = self.env, self.current_func, self.call_depth
+    if depth >= self.call_depth_limit:
+      super().error(
+        ErrorType.DEPTH_LIMIT_ERROR,
+        "Program exceeded its call depth limit of {} in function {}",
+        node=call_node,
+        args=(self.call_depth_limit, caller),
+        function=caller,
+      )
+    frame = frame_pool.acquire()
+    try:
+      # arguments are evaluated in the caller's environment and bound in a pooled frame
+      for decl_arg, arg_type, passin in zip(func_args_list, func_arg_types, passin_args_list):
+        value = self.evaluate_expression(passin)
+        if type(value) is StringView:
+          value = compact(value)
+        if arg_type is not None and not matches_type(value, arg_type):
           super().error(
-            ErrorType.NAME_ERROR,
-            f"Variable {var_name} has not been defined",
+            ErrorType.TYPE_ERROR,
+            "Incompatible type for argument {} of function {}",
+            node=call_node,
+            args=(decl_arg, func_name),
           )
-        # TODO: no value before? Here have a default init
-        return self.variable_name_to_value[var_name], self.var_to_type[var_name]
-    elif node_type == 'neg':
-      if self.evaluate_expression(node_dict["op1"])[1] != "int":
+        frame.define(decl_arg, value, arg_type)
+        self.charge_memory(value_size(value), call_node)
+      self.env, self.current_func, self.call_depth = frame, func_name, depth + 1
+      returned = self.run_block(func_body)
+    except RaisedException:
+      # a raise passing through this call, possibly from an argument: give the frame back
+      # and resume unwinding
+      self.memory_used -= frame_pool.release(frame)
+      self.env, self.current_func, self.call_depth = caller_env, caller, depth
+      raise
+    result = self.return_value if returned else NIL
+    self.memory_used -= frame_pool.release(frame)
+    self.env, self.current_func, self.call_depth = caller_env, caller, depth
+    return result
+
+  # returns True when the statement was a return, so enclosing blocks stop running
+  def run_statement(self, statement_node):
+    return self.statement_handlers[type(statement_node)](self, statement_node)
+
+  def run_definition(self, statement_node):
+    var_name = statement_node.name
+    var_type = statement_node.var_type
+    value = self.default_value(var_type, statement_node)
+    if not self.env.define(var_name, value, self.declared_type(var_type, statement_node)):
+      super().error(
+        ErrorType.NAME_ERROR,
+        "Variable {} defined more than once",
+        node=statement_node,
+        args=(var_name,),
+      )
+    # the scope gives value_size(value) back when it is popped
+    self.charge_memory(value_size(value), statement_node)
+
+  def run_func_call(self, statement_node):
+    self.call_function(statement_node)
+
+  def run_if(self, statement_node):
+    if_statements = statement_node.statements
+    else_statements = statement_node.else_statements
+    result = self.evaluate_expression(statement_node.condition)
+    if type(result) is not bool:
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Condition of the if statement does not evaluate to a boolean",
+        node=statement_node,
+      )
+    if result:
+      self.steps += self.block_cost(if_statements)
+      return self.run_scoped_block(if_statements)
+    elif else_statements != None:
+      self.steps += self.block_cost(else_statements)
+      return self.run_scoped_block(else_statements)
+
+  def run_for(self, statement_node):
+    loop_cond = statement_node.condition
+    update = statement_node.update
+    loop_body = statement_node.statements
+    self.run_statement(statement_node.init)
+    iteration_cost = self.iteration_cost(statement_node)
+    while True:
+      result = self.evaluate_expression(loop_cond)
+      if type(result) is not bool:
         super().error(
-            ErrorType.TYPE_ERROR,
-            "Unable to negate a non-integer type by '-'",
+          ErrorType.TYPE_ERROR,
+          "Terminating condition of the for statement does not evaluate to a boolean",
+          node=statement_node,
         )
-      op1 = self.evaluate_expression(node_dict['op1'])[0]
-      return op1 * (-1), "int"
-    elif node_type == '!':
-      if self.evaluate_expression(node_dict["op1"])[1] != "bool":
-        super().error(
-              ErrorType.TYPE_ERROR,
-              "Unable to negate a non-boolean type by '!'",
-          )
-      op1 = self.evaluate_expression(node_dict['op1'])[0]
-      return False if op1 else True, "bool"
-    elif node_type == '+':
-      if self.evaluate_expression(node_dict['op1'])[1] != "int" or self.evaluate_expression(node_dict['op2'])[1] != "int":
-        if self.evaluate_expression(node_dict['op1'])[1] != "string" or self.evaluate_expression(node_dict['op2'])[1] != "string":
+      if not result:
+        break
+      if self.run_scoped_block(loop_body):
+        return True
+      self.run_statement(update)
+      self.steps += iteration_cost
+      if self.steps >= self.next_check:
+        self.check_limits(update)
+
+  # a raise is a single Python exception that unwinds every Brewin call in between (see
+  # call_function) to the innermost try. Entering a try charges the body's cost and pushes a
+  # scope only if the body defines variables of its own (see try_plan)
+  def run_try(self, statement_node):
+    plan = statement_node.plan
+    if not plan:
+      self.try_plan(statement_node)
+    env = self.env
+    depth = len(env.scopes)
+    try:
+      self.steps += plan[0]
+      if plan[1]:
+        return self.run_scoped_block(statement_node.statements)
+      return self.run_block(statement_node.statements)
+    except RaisedException as e:
+      self.memory_used -= env.unwind(depth)
+      handler = plan[2].get(e.exception_type)
+      if handler is None:
+        raise
+      self.steps += self.block_cost(handler)
+      return self.run_scoped_block(handler)
+
+  # fills in a try node's plan on its first run: the body's cost, whether the body defines
+  # variables, and its catch table, exception_type -> catch body. The first catcher of each
+  # type wins, as a scan of the catchers would
+  def try_plan(self, try_node):
+    statements = try_node.statements
+    table = dict()
+    for catcher in try_node.catchers:
+      table.setdefault(catcher.exception_type, catcher.statements)
+    try_node.plan.extend(
+      (self.block_cost(statements), any(is_definition(statement) for statement in statements), table))
+
+  def run_raise(self, statement_node):
+    exception_type = self.evaluate_expression(statement_node.exception_type)
+    if type(exception_type) not in STRING_TYPES:
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Raised exception type must be a string",
+        node=statement_node,
+      )
+    raise RaisedException(str(exception_type), statement_node)
+
+  # `a.b.c = expression`: the expression is evaluated first, then the path is walked
+  def run_field_assignment(self, statement_node):
+    path = statement_node.path
+    value = self.evaluate_expression(statement_node.expression)
+    if type(value) is StringView:
+      value = compact(value)
+    binding = self.env.lookup(path.base)
+    if binding is None:
+      super().error(
+        ErrorType.NAME_ERROR,
+        "Variable {} has not been defined",
+        node=statement_node,
+        args=(path.base,),
+      )
+    target = binding.value
+    if type(target) is Struct:
+      entry = self.field_path_entry(path, target.layout)
+      if entry is not None:
+        try:
+          for index in entry[2]:
+            target = target.fields[index]
+          fields = target.fields
+        except AttributeError:
+          target = binding.value  # a nil link; the walk below reports it
+        else:
+          if not matches_type(value, entry[4]):
             super().error(
               ErrorType.TYPE_ERROR,
-              "Incompatible types for '+' operation",
+              "Incompatible type for field {} of struct {}",
+              node=statement_node,
+              args=(path.fields[-1], target.layout.name),
             )
-            return
-      op1 = self.evaluate_expression(node_dict['op1'])[0]
-      op2 = self.evaluate_expression(node_dict['op2'])[0]
-      return op1 + op2, "int"
-
-    elif node_type == '-' or node_type == '*' or node_type == '/':
-        # TODO: string concat
-        if self.evaluate_expression(node_dict['op1'])[1] != "int" or self.evaluate_expression(node_dict['op2'])[1] != "int":
-          super().error(
-            ErrorType.TYPE_ERROR,
-            "Incompatible types for arithmetic operation",
-          )
+          self.store_slot(target, entry[3], value, statement_node)
           return
-        op1 = self.evaluate_expression(node_dict['op1'])[0]
-        op2 = self.evaluate_expression(node_dict['op2'])[0]
-        return (op1 - op2 if node_type == '-' else op1 * op2 if node_type == '*' else op1 // op2), "int"
-    
-    elif node_type == '==' or node_type == '!=' :
-      if self.evaluate_expression(node_dict['op1'])[1] != self.evaluate_expression(node_dict['op2'])[1]:
-        return False, "bool"
-      if self.evaluate_expression(node_dict['op1'])[1] == "nil":
-        return False, "bool"
-      op1 = self.evaluate_expression(node_dict['op1'])[0]
-      op2 = self.evaluate_expression(node_dict['op2'])[0]
-      return (op1 == op2 if node_type == '==' else op1 != op2), "bool"
-
-    elif node_type == '<' or node_type == '<=' or node_type == '>' or node_type == '>=':
-        if self.evaluate_expression(node_dict['op1'])[1] != self.evaluate_expression(node_dict['op2'])[1]:
-          super().error(
-            ErrorType.TYPE_ERROR,
-            "Unsupported comparison between incompatible types",
-          )
-          return
-        op1 = self.evaluate_expression(node_dict['op1'])[0]
-        op2 = self.evaluate_expression(node_dict['op2'])[0]
-        return (op1 < op2 if node_type == '<' else op1 <= op2 if node_type == '<=' else op1 > op2 if node_type == '>' else op1 >= op2), "bool"
-    elif node_type == '&&' or node_type == '||':
-      op1 = self.evaluate_expression(node_dict['op1'])[0]
-      op2 = self.evaluate_expression(node_dict['op2'])[0]
-      # TODO: seems && || for not both boolean are not specified in spec
-      return op1 and op2 if node_type == '&&' else op1 or op2, "bool"
+    fields = path.fields
+    for field_name in fields[:-1]:
+      target = self.load_field(target, field_name, path)
+    self.store_field(target, fields[-1], value, statement_node)
 
-    
-    # TODO: expression node representing a function call
-    elif node_type == 'fcall':
-      func_name = node_dict['name']
-      args_list = node_dict['args']
-      if func_name == 'print':
-        super().error(
+  def run_return(self, statement_node):
+    expression = statement_node.expression
+    self.return_value = NIL if expression is None else self.evaluate_expression(expression)
+    return True
+
+  # statements with no effect of their own, e.g. a bare expression
+  def run_nothing(self, statement_node):
+    pass
+
+  def do_assignment(self, statement_node):
+    var_name = statement_node.name 
+    binding = self.env.lookup(var_name)
+    if binding is None:
+      super().error(
         ErrorType.NAME_ERROR,
-        "Unable to evaluate a print function call. Do you mean 'inputi()'?",
-        ) 
-        return
-      if func_name != 'inputi':
+        "Variable {} has not been defined",
+        node=statement_node,
+        args=(var_name,),
+      )
+      return
+    source_node = statement_node.expression
+    value = self.evaluate_expression(source_node)
+    # a stored substring view must not pin a much larger string
+    if type(value) is StringView:
+      value = compact(value)
+    if binding.var_type is not None and not matches_type(value, binding.var_type):
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Incompatible type for variable {}",
+        node=statement_node,
+        args=(var_name,),
+      )
+    self.charge_memory(value_size(value) - value_size(binding.value), statement_node)
+    binding.value = value
+
+  # charges a change in the bytes held by stored values to the memory quota, after taking off
+  # what freed structs and maps gave back
+  def charge_memory(self, delta, node):
+    freed = self.freed_memory
+    if freed.sizes:
+      delta -= freed.take()
+    self.memory_used += delta
+    if self.memory_used > self.peak_memory:
+      if self.memory_used > self.memory_limit:
+        # structs and maps in reference cycles are only freed by the cycle collector
+        gc.collect()
+        self.memory_used -= freed.take()
+        if self.memory_used > self.memory_limit:
+          self.memory_limit_exceeded(node)
+      self.peak_memory = max(self.peak_memory, self.memory_used)
+
+  def memory_limit_exceeded(self, node):
+    super().error(
+      ErrorType.MEMORY_LIMIT_ERROR,
+      "Program exceeded its memory limit of {} bytes in function {}",
+      node=node,
+      args=(self.memory_limit, self.current_func),
+      function=self.current_func,
+    )
+
+  def get_peak_memory(self):
+    return self.peak_memory
+
+  def evaluate_expression(self, expression_node):
+    return self.expression_handlers[type(expression_node)](self, expression_node)
+
+  def evaluate_literal(self, expression_node):
+    return expression_node.val
+
+  def evaluate_nil(self, expression_node):
+    return NIL
+
+  def evaluate_var(self, expression_node):
+    var_name = expression_node.name
+    binding = self.env.lookup(var_name)
+    if binding is None:
+      super().error(
+        ErrorType.NAME_ERROR,
+        "Variable {} has not been defined",
+        node=expression_node,
+        args=(var_name,),
+      )
+    return binding.value
+
+  def evaluate_field_path(self, expression_node):
+    binding = self.env.lookup(expression_node.base)
+    if binding is None:
+      super().error(
+        ErrorType.NAME_ERROR,
+        "Variable {} has not been defined",
+        node=expression_node,
+        args=(expression_node.base,),
+      )
+    value = binding.value
+    if type(value) is Struct:
+      entry = self.field_path_entry(expression_node, value.layout)
+      if entry is not None:
+        try:
+          for index in entry[1]:
+            value = value.fields[index]
+          return value
+        except AttributeError:
+          value = binding.value  # a nil link; the walk below reports it
+    for field_name in expression_node.fields:
+      value = self.load_field(value, field_name, expression_node)
+    return value
+
+  # the path node's cache entry for paths starting at a struct of this layout, resolved and
+  # cached on a miss; None once the site has seen FIELD_CACHE_LIMIT layouts
+  def field_path_entry(self, path_node, layout):
+    cache = path_node.cache
+    for entry in cache:
+      if entry[0] is layout:
+        return entry
+    if len(cache) >= FIELD_CACHE_LIMIT:
+      return None
+    entry = resolve_field_path(layout, path_node.fields)
+    if entry is not None:
+      cache.append(entry)
+    return entry
+
+  # reads one field of a struct value; every step of a path checks for nil
+  def load_field(self, value, field_name, node):
+    index = self.field_slot(value, field_name, node)
+    return value.fields[index]
+
+  def store_field(self, value, field_name, new_value, node):
+    index = self.field_slot(value, field_name, node)
+    if not matches_type(new_value, value.layout.field_types[index]):
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Incompatible type for field {} of struct {}",
+        node=node,
+        args=(field_name, value.layout.name),
+      )
+    self.store_slot(value, index, new_value, node)
+
+  # stores value in a slot of struct, charging the change in bytes the struct holds
+  def store_slot(self, struct, index, value, node):
+    delta = value_size(value) - value_size(struct.fields[index])
+    if delta:
+      struct.size += delta
+      self.charge_memory(delta, node)
+    struct.fields[index] = value
+
+  # slot index of field_name in the struct value
+  def field_slot(self, value, field_name, node):
+    if type(value) is Struct:
+      index = value.layout.field_index.get(field_name)
+      if index is None:
         super().error(
           ErrorType.NAME_ERROR,
-          f"Function {func_name} has not been defined",
+          "Struct {} has no field {}",
+          node=node,
+          args=(value.layout.name, field_name),
         )
-        return
-      if len(args_list) == 0:
-        user_input = super().get_input()
-        user_input = int(user_input)
-        return user_input, "int"
-      elif len(args_list) == 1:
-        super().output(args_list[0])
-        user_input = super().get_input()
-        user_input = int(user_input)
-        # TODO: Can assume an integer input?
-        return user_input, "int"
-      else:
-        super().error(
-          ErrorType.NAME_ERROR,
-          f"No inputi() function found that takes > 1 parameter",
+      return index
+    if value is NIL:
+      super().error(
+        ErrorType.FAULT_ERROR,
+        "Unable to access field {} of nil",
+        node=node,
+        args=(field_name,),
+      )
+    super().error(
+      ErrorType.TYPE_ERROR,
+      "Unable to access field {} of a non-struct value",
+      node=node,
+      args=(field_name,),
+    )
+
+  def evaluate_new(self, expression_node):
+    layout = self.struct_layouts.get(expression_node.var_type)
+    if layout is None:
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Unknown struct type {}",
+        node=expression_node,
+        args=(expression_node.var_type,),
+      )
+    instance = layout.instantiate()
+    self.charge_memory(instance.size, expression_node)
+    return instance
+
+  def evaluate_neg(self, expression_node):
+    op1 = self.evaluate_expression(expression_node.op1)
+    if type(op1) is not int:
+      super().error(
+          ErrorType.TYPE_ERROR,
+          "Unable to negate a non-integer type by '-'",
+          node=expression_node,
+      )
+    return -op1
+
+  def evaluate_not(self, expression_node):
+    op1 = self.evaluate_expression(expression_node.op1)
+    if type(op1) is not bool:
+      super().error(
+            ErrorType.TYPE_ERROR,
+            "Unable to negate a non-boolean type by '!'",
+            node=expression_node,
         )
-      
+    return not op1
+
+  def evaluate_add(self, expression_node):
+    op1 = self.evaluate_expression(expression_node.op1)
+    op2 = self.evaluate_expression(expression_node.op2)
+    if type(op1) is not int or type(op2) is not int:
+      if type(op1) not in STRING_TYPES or type(op2) not in STRING_TYPES:
+          super().error(
+            ErrorType.TYPE_ERROR,
+            "Incompatible types for '+' operation",
+            node=expression_node,
+          )
+      # refuse to build a string that could never be stored under the quota
+      if len(op1) + len(op2) > self.memory_limit:
+        self.memory_limit_exceeded(expression_node)
+      return concat(op1, op2)
+    return op1 + op2
+
+  # operands of '-', '*' and '/' must both be ints
+  def evaluate_int_operands(self, expression_node):
+    op1 = self.evaluate_expression(expression_node.op1)
+    op2 = self.evaluate_expression(expression_node.op2)
+    if type(op1) is not int or type(op2) is not int:
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Incompatible types for arithmetic operation",
+        node=expression_node,
+      )
+    return op1, op2
+
+  def evaluate_subtract(self, expression_node):
+    op1, op2 = self.evaluate_int_operands(expression_node)
+    return op1 - op2
+
+  def evaluate_multiply(self, expression_node):
+    op1, op2 = self.evaluate_int_operands(expression_node)
+    return op1 * op2
+
+  def evaluate_divide(self, expression_node):
+    op1, op2 = self.evaluate_int_operands(expression_node)
+    if op2 == 0:
+      raise RaisedException("div0", expression_node)
+    return op1 // op2
+
+  def evaluate_equal(self, expression_node):
+    op1 = self.evaluate_expression(expression_node.op1)
+    op2 = self.evaluate_expression(expression_node.op2)
+    # nil, structs and arrays compare by reference
+    if type(op1) in REFERENCE_TYPES or type(op2) in REFERENCE_TYPES:
+      return op1 is op2
+    if not same_type(op1, op2):
+      return False
+    return op1 == op2
+
+  def evaluate_not_equal(self, expression_node):
+    op1 = self.evaluate_expression(expression_node.op1)
+    op2 = self.evaluate_expression(expression_node.op2)
+    if type(op1) in REFERENCE_TYPES or type(op2) in REFERENCE_TYPES:
+      return op1 is not op2
+    if not same_type(op1, op2):
+      return True
+    return op1 != op2
+
+  # operands of '<', '<=', '>' and '>=' must have the same type, and not a reference type
+  def evaluate_comparable_operands(self, expression_node):
+    op1 = self.evaluate_expression(expression_node.op1)
+    op2 = self.evaluate_expression(expression_node.op2)
+    if not same_type(op1, op2) or type(op1) in REFERENCE_TYPES:
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Unsupported comparison between incompatible types",
+        node=expression_node,
+      )
+    return op1, op2
+
+  def evaluate_less(self, expression_node):
+    op1, op2 = self.evaluate_comparable_operands(expression_node)
+    return op1 < op2
+
+  def evaluate_less_equal(self, expression_node):
+    op1, op2 = self.evaluate_comparable_operands(expression_node)
+    return op1 <= op2
+
+  def evaluate_greater(self, expression_node):
+    op1, op2 = self.evaluate_comparable_operands(expression_node)
+    return op1 > op2
+
+  def evaluate_greater_equal(self, expression_node):
+    op1, op2 = self.evaluate_comparable_operands(expression_node)
+    return op1 >= op2
+
+  # operands of '&&' and '||' must both be bools
+  def evaluate_bool_operands(self, expression_node):
+    op1 = self.evaluate_expression(expression_node.op1)
+    op2 = self.evaluate_expression(expression_node.op2)
+    if type(op1) is not bool or type(op2) is not bool:
+      super().error(
+        ErrorType.TYPE_ERROR,
+        "Incompatible types for logical operation",
+        node=expression_node,
+      )
+    return op1, op2
+
+  def evaluate_and(self, expression_node):
+    op1, op2 = self.evaluate_bool_operands(expression_node)
+    return op1 and op2
+
+  def evaluate_or(self, expression_node):
+    op1, op2 = self.evaluate_bool_operands(expression_node)
+    return op1 or op2
+
+  def evaluate_func_call(self, expression_node):
+    return self.call_function(expression_node)
+
+  # expressions without an evaluator yet
+  def evaluate_nothing(self, expression_node):
+    return None
+
 
+# node class -> handler; node classes derived from a registered one (such as the frozen
+# classes of a hash-consed tree) use their base's handler, and unknown nodes the default
+class HandlerTable(dict):
+  def __init__(self, handlers, default):
+    super().__init__(handlers)
+    self.default = default
 
+  def __missing__(self, node_class):
+    handler = self.default
+    for base in node_class.__mro__[1:]:
+      if base in self:
+        handler = self[base]
+        break
+    self[node_class] = handler
+    return handler
 
+Interpreter.statement_handlers = HandlerTable({
+  VarDefNode: Interpreter.run_definition,
+  AssignNode: Interpreter.do_assignment,
+  FieldAssignNode: Interpreter.run_field_assignment,
+  FCallNode: Interpreter.run_func_call,
+  IfNode: Interpreter.run_if,
+  ForNode: Interpreter.run_for,
+  ReturnNode: Interpreter.run_return,
+  TryNode: Interpreter.run_try,
+  RaiseNode: Interpreter.run_raise,
+}, Interpreter.run_nothing)
 
+Interpreter.expression_handlers = HandlerTable({
+  IntNode: Interpreter.evaluate_literal,
+  StringNode: Interpreter.evaluate_literal,
+  BoolNode: Interpreter.evaluate_literal,
+  NilNode: Interpreter.evaluate_nil,
+  VarNode: Interpreter.evaluate_var,
+  FieldPathNode: Interpreter.evaluate_field_path,
+  NewNode: Interpreter.evaluate_new,
+  NegNode: Interpreter.evaluate_neg,
+  NotNode: Interpreter.evaluate_not,
+  AddNode: Interpreter.evaluate_add,
+  SubtractNode: Interpreter.evaluate_subtract,
+  MultiplyNode: Interpreter.evaluate_multiply,
+  DivideNode: Interpreter.evaluate_divide,
+  EqualNode: Interpreter.evaluate_equal,
+  NotEqualNode: Interpreter.evaluate_not_equal,
+  LessNode: Interpreter.evaluate_less,
+  LessEqualNode: Interpreter.evaluate_less_equal,
+  GreaterNode: Interpreter.evaluate_greater,
+  GreaterEqualNode: Interpreter.evaluate_greater_equal,
+  AndNode: Interpreter.evaluate_and,
+  OrNode: Interpreter.evaluate_or,
+  FCallNode: Interpreter.evaluate_func_call,
+}, Interpreter.evaluate_nothing)
 
-program = """ 
+if __name__ == "__main__":
+  program = """ 
 func foo(c){
   print("Do nothing");
   print(c);
@@ -331,6 +1055,5 @@ func main() {
 
 }
 """
-# TODO: print True/False, lower case?
-interpreter = Interpreter()
-interpreter.run(program)   
+  interpreter = Interpreter()
+  interpreter.run(program)   
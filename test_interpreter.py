@@ -0,0 +1,494 @@
+# Behavioral checks for the interpreter, run with `python -m pytest`
+import io
+import os
+import sys
+import threading
+
+import pytest
+
+import interpreterv2
+from brewio import FileDescriptorSink, IteratorInput, MemoryLogSink, MmapInput, StreamInput
+from brewlex import symbol_table
+from brewparse import parse_program
+from brewvalues import FreedMemory, Rope, StringView
+from interpreterv2 import Interpreter
+from intbase import BrewinError, BrewinNameError, ErrorType
+
+
+def run(program, **run_options):
+    interpreter = Interpreter(console_output=False)
+    interpreter.run(program, **run_options)
+    return interpreter
+
+
+def error_of(program, **run_options):
+    with pytest.raises(BrewinError) as info:
+        run(program, **run_options)
+    return info.value
+
+
+# run limits
+
+def test_limit_errors_name_the_function():
+    program = "func spin(n) {\n  var i;\n  for (i = 0; i < n; i = i + 1) { n = n + 1; }\n}\nfunc main() { spin(5); }"
+    error = error_of(program, step_limit=10000)
+    assert (error.error_type, error.function, error.line_num) == (ErrorType.STEP_LIMIT_ERROR, "spin", 3)
+
+
+
+def test_deep_recursion_is_a_brewin_error():
+    countdown = "func f(n) {\n  if (n == 0) { return 0; }\n  return 1 + f(n - 1);\n}\n"
+    assert run(countdown + "func main() { print(f(999)); }").get_output() == ["999"]
+    assert run(countdown + "func main() { print(f(5000)); }", call_depth_limit=5001).get_output() == ["5000"]
+    error = error_of(countdown + "func main() { print(f(1000)); }")
+    assert (error.error_type, error.function, error.line_num) == (ErrorType.DEPTH_LIMIT_ERROR, "f", 3)
+    error = error_of("func f(n) { return f(n + 1); }\nfunc main() { f(0); }", step_limit=10**9, call_depth_limit=10)
+    assert error.error_type == ErrorType.DEPTH_LIMIT_ERROR
+    assert error_of("func main() { print(" + "-" * 100000 + "1); }").error_type == ErrorType.DEPTH_LIMIT_ERROR
+
+
+# streaming runs
+
+LOOP = "func main() { var i; for (i = 0; i < 100; i = i + 1) { print(i); } }"
+
+
+def test_run_after_iter_run():
+    interpreter = Interpreter(console_output=False)
+    assert len(list(interpreter.iter_run(LOOP))) == 100
+    stream = interpreter.iter_run(LOOP)
+    next(stream)
+    stream.close()
+    interpreter.run(LOOP)
+    assert len(interpreter.get_output()) == 100
+
+
+def test_iter_run_refuses_console_input(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda: pytest.fail("a streaming run waited on the console"))
+    program = 'func main() { print("a"); print(inputi() + 1); }'
+    interpreter = Interpreter(console_output=False)
+    stream = interpreter.iter_run(program)
+    assert next(stream) == "a"
+    with pytest.raises(BrewinError) as info:
+        next(stream)
+    assert (info.value.error_type, info.value.line_num) == (ErrorType.FAULT_ERROR, 1)
+    assert list(Interpreter(console_output=False, inp=["41"]).iter_run(program)) == ["a", "42"]
+    monkeypatch.setattr("builtins.input", lambda: "41")
+    interpreter.run(program)  # a plain run may read the console again
+    assert interpreter.get_output() == ["a", "42"]
+
+
+def test_concurrent_iter_runs():
+    programs = [f'func main() {{ print("program {k}"); }}' + "".join(
+        f"\nfunc f{j}(a) {{ var b; b = a * 2 + 1; if (b > 3) {{ print(b); }} return b; }}" for j in range(100))
+        for k in range(8)]
+    results = [None] * len(programs)
+
+    def stream(k):
+        try:
+            results[k] = list(Interpreter(console_output=False).iter_run(programs[k]))
+        except Exception as e:
+            results[k] = e
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads often enough for parses to interleave
+    try:
+        threads = [threading.Thread(target=stream, args=(k,)) for k in range(len(programs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert results == [[f"program {k}"] for k in range(len(programs))]
+
+
+# strings
+
+def test_rope_appends_keep_older_versions():
+    program = """func main() {
+  var s; var t; var u; var i;
+  s = "";
+  for (i = 0; i < 1000; i = i + 1) { s = s + "xy"; }
+  print(len(s), " ", s == repeat("xy", 1000));
+  t = s + "b"; s = t + "d"; u = t + "c";
+  print(substring(t, 1999, len(t)), " ", substring(s, 1999, len(s)), " ", substring(u, 1999, len(u)));
+}"""
+    interpreter = run(program)
+    assert interpreter.get_output() == ["2000 true", "yb ybd ybc"]
+    assert type(interpreter.env.lookup("s").value) is Rope
+
+
+def test_string_builtins():
+    program = """func main() {
+  print(len("héllo"), " ", substring("hello", 1, 3), " ", find("hello", "l"), " ", find("hello", "l", 3),
+        " ", find("hello", "z"));
+  print(repeat("ab", 3), " ", join(", ", "a", "b", "c"), " ", join("-"), " ", toint("-12") + 1);
+  print(min(3, 1, 2), " ", max(3, 1, 2));
+}"""
+    assert run(program).get_output() == ["5 el 2 3 -1", "ababab a, b, c  -11", "1 3"]
+    for call, error_type in (
+        ('substring("abc", 2, 1)', ErrorType.FAULT_ERROR),
+        ('find("abc", 1)', ErrorType.TYPE_ERROR),
+        ('repeat("a", -1)', ErrorType.FAULT_ERROR),
+        ('toint("x1")', ErrorType.TYPE_ERROR),
+        ('toint("1_000")', ErrorType.TYPE_ERROR),
+        ('toint(" 12")', ErrorType.TYPE_ERROR),
+        ('toint("+3")', ErrorType.TYPE_ERROR),
+        ('toint(repeat("9", 5000))', ErrorType.TYPE_ERROR),
+        ('max(1, "2")', ErrorType.TYPE_ERROR),
+    ):
+        assert error_of(f"func main() {{ {call}; }}").error_type == error_type
+    assert error_of('func main() { repeat("ab", 1000); }', memory_limit=100).error_type == ErrorType.MEMORY_LIMIT_ERROR
+
+
+def test_substring_views_and_compaction():
+    program = """func main() {
+  var big; var kept; var small; var inner; var v;
+  big = repeat("0123456789", 1000);
+  kept = substring(big, 5, 9005);
+  small = substring(big, 10, 110);
+  inner = substring(kept, 5, 105);
+  print(inner == small, " ", find(kept, "9", 10), " ", len(inner), " ", substring(inner, 0, 3));
+  v = substring(small, 0, 80);
+}"""
+    interpreter = run(program)
+    assert interpreter.get_output() == ["true 14 100 012"]
+    values = {name: interpreter.env.lookup(name).value for name in ("big", "kept", "small", "inner", "v")}
+    # views stored in variables keep a large buffer alive only if they cover enough of it
+    assert type(values["kept"]) is StringView and values["kept"].buffer is values["big"]
+    assert type(values["small"]) is str and type(values["inner"]) is str
+    assert type(values["v"]) is StringView and values["v"].buffer is values["small"]
+
+
+# interning
+
+def test_names_and_string_literals_are_interned():
+    ast = parse_program('func main() {\n  var total;\n  total = "sum";\n  print(total, "sum");\n}')
+    definition, assignment, call = ast.functions[0].statements
+    assert definition.name is assignment.name is call.args[0].name
+    assert assignment.expression.val is call.args[1].val
+    assert symbol_table == {}  # a parse keeps nothing alive once it is done
+
+
+# hash-consing
+
+def test_expressions_are_shared_across_lines():
+    ast = parse_program("func f(a) {\n  a = a * 2 + 1;\n  return a * 2 + 1;\n}\nfunc g(a) { a = a * 2 + 1; }", hash_cons=True)
+    f, g = ast.functions
+    assert f.statements[0].expression is f.statements[1].expression is g.statements[0].expression
+    assert [statement.line_num for statement in f.statements + g.statements] == [2, 3, 5]
+
+
+def test_hash_consed_nodes_keep_their_lines(monkeypatch):
+    monkeypatch.setattr(interpreterv2, "parse_program", lambda program: parse_program(program, hash_cons=True))
+    program = "func main() {\n  if (false) { print(q + 1); }\n  print(5);\n  print(q + 1);\n}"
+    assert error_of(program).line_num == 4
+    program = "func f(x) {\n  return x / 0;\n}\nfunc main() {\n  print(1 / 0 + 1);\n  f(1);\n}"
+    error = error_of(program.replace("print(1 / 0 + 1);", "try { print(1 / 0 + 1); } catch \"div0\" { print(0); }"))
+    assert (error.error_type, error.line_num) == (ErrorType.FAULT_ERROR, 2)
+    assert error_of(program).line_num == 5
+
+
+# structs and declared types
+
+def test_typed_defaults_are_charged_and_released():
+    interpreter = run("func main() { var i; for (i = 0; i < 1000; i = i + 1) { var s: string; } }")
+    assert interpreter.memory_used == 0
+    assert interpreter.get_peak_memory() > 0
+
+
+def test_struct_fields_count_against_the_quota():
+    program = """struct node { s: string; next: node; }
+func main() {
+  var s; var i; var head: node; var n: node;
+  s = repeat("x", 50000);
+  for (i = 0; i < 200; i = i + 1) { n = new node; n.s = s; n.next = head; head = n; }
+}"""
+    assert error_of(program, memory_limit=100000).error_type == ErrorType.MEMORY_LIMIT_ERROR
+
+
+def test_freed_structs_give_their_bytes_back():
+    program = """struct node { s: string; }
+func make(s) { var n: node; n = new node; n.s = s; return n; }
+func main() { var s; var i; var t: node; s = repeat("x", 50000); for (i = 0; i < 200; i = i + 1) { t = make(s); } }"""
+    assert run(program, memory_limit=300000).get_peak_memory() < 300000
+
+
+def test_cyclic_struct_garbage_is_collected_before_the_limit():
+    program = """struct node { s: string; next: node; }
+func main() {
+  var s; var i; var t: node;
+  s = repeat("x", 50000);
+  for (i = 0; i < 200; i = i + 1) { t = new node; t.s = s; t.next = t; }
+}"""
+    assert run(program, memory_limit=400000).get_peak_memory() <= 400000
+
+
+def test_freed_memory_from_other_threads_is_not_lost():
+    freed = FreedMemory()
+    taken = []
+
+    def free():
+        for _ in range(10000):
+            freed.add(1)
+
+    threads = [threading.Thread(target=free) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        taken.append(freed.take())
+    for thread in threads:
+        thread.join()
+    assert sum(taken) + freed.take() == 40000
+
+
+def test_equality_across_types():
+    program = """struct p { x: int; }
+func main() {
+  var a: p; var b: p;
+  a = new p;
+  print(1 == "1", " ", 1 != "1", " ", true != 1, " ", "ab" != substring(repeat("ab", 50), 0, 2));
+  print(nil != 5, " ", a != nil, " ", a != b, " ", a == a, " ", b == nil);
+}"""
+    assert run(program).get_output() == ["false true true false", "true true true true true"]
+
+
+def test_declared_types_are_enforced():
+    assert error_of('func main() { var a: int; a = "x"; }').error_type == ErrorType.TYPE_ERROR
+    program = "struct a { v: int; }\nstruct b { w: int; }\nfunc main() { var x: a; x = new b; }"
+    assert error_of(program).error_type == ErrorType.TYPE_ERROR
+    program = 'func f(x: int) { return x; }\nfunc main() { f("no"); }'
+    assert error_of(program).error_type == ErrorType.TYPE_ERROR
+
+
+# field paths
+
+def test_field_paths_across_many_layouts():
+    # bump's two field sites see more layouts than they cache, with v in a different slot in each
+    structs = "\n".join(
+        f"struct s{k} {{ " + "".join(f"f{j}: int; " for j in range(k)) + "v: int; link: s0; }" for k in range(6))
+    program = structs + """
+func bump(x, n) { x.v = x.v + n; return x.v; }
+func main() {
+  var x;
+""" + "\n".join(f"  x = new s{k}; print(bump(x, {k}), bump(x, 1));" for k in range(6)) + """
+  x = new s3; x.link = new s0; x.link.v = 7; print(x.link.v);
+  x.link = nil;
+  print(x.link.v);
+}"""
+    interpreter = Interpreter(console_output=False)
+    with pytest.raises(BrewinError) as info:
+        interpreter.run(program)
+    assert interpreter.get_output() == ["01", "12", "23", "34", "45", "56", "7"]
+    assert (info.value.error_type, info.value.line_num) == (ErrorType.FAULT_ERROR, 18)
+
+
+# exceptions
+
+def test_try_catch_and_scopes():
+    program = """func main() {
+  var i;
+  for (i = 0; i < 3; i = i + 1) {
+    try { var x; x = i; if (i == 1) { raise "odd"; } print(x); } catch "odd" { var x; x = 9; print(x); }
+  }
+  try { print(1 / 0); } catch "div0" { print("div0"); }
+}"""
+    assert run(program).get_output() == ["0", "9", "2", "div0"]
+    assert error_of('func main() { raise "boom"; }').error_type == ErrorType.FAULT_ERROR
+
+
+def test_raising_argument_releases_the_frame():
+    program = """func f(a, b) { return 0; }
+func main() {
+  var s; var i;
+  s = repeat("x", 100000);
+  for (i = 0; i < 50; i = i + 1) { try { f(s, 1 / 0); } catch "div0" { i = i; } }
+  print(i);
+}"""
+    assert run(program, memory_limit=10**6).get_output() == ["50"]
+
+
+def test_first_matching_catcher_handles_a_raise():
+    program = """func fail(kind) { raise kind + "!"; }
+func attempt(kind) {
+  try { fail(kind); } catch "a!" { print("inner a"); } catch "b!" { print("inner b"); } catch "a!" { print("second a"); }
+}
+func main() {
+  try { attempt("a"); attempt("b"); attempt("c"); print("not reached"); } catch "c!" { print("outer c"); }
+}"""
+    assert run(program).get_output() == ["inner a", "inner b", "outer c"]
+
+
+# errors
+
+def test_error_description_is_formatted_when_read():
+    error = error_of("func main() {\n  print(q);\n}")
+    assert isinstance(error, BrewinNameError)
+    assert str(error) == "ErrorType.NAME_ERROR on line 2: Variable q has not been defined"
+
+
+# builtins
+
+def test_registered_builtins():
+    interpreter = Interpreter(console_output=False)
+    interpreter.register_builtin("twice", 1, lambda interpreter, node, value: value * 2)
+    interpreter.register_builtin("count", None, lambda interpreter, node, *args: len(args))
+    interpreter.register_builtin("count", 1, lambda interpreter, node, value: -1)
+    program = """func min(a, b) { return 0; }
+func main() {
+  print(twice(21)); print(count()); print(count(1)); print(count(1, 2)); print(min(3, 4)); print(min(3, 4, 5));
+}"""
+    interpreter.run(program)
+    assert interpreter.get_output() == ["42", "0", "-1", "2", "0", "3"]
+    assert error_of("func main() { twice(1); }").error_type == ErrorType.NAME_ERROR
+
+
+# arrays
+
+def test_array_get_set_and_copy():
+    program = """func main() {
+  var a; var b; var i;
+  a = array(5);
+  for (i = 0; i < 5; i = i + 1) { set(a, i, i * i); }
+  b = copy(a);
+  set(b, 0, 9);
+  copy(a, 1, a, 0, 4);
+  print(a); print(b); print(get(a, 4), " ", size(b), " ", a == b, " ", a == a);
+  fill(b, -1); print(b); print(array(2, 7));
+}"""
+    assert run(program).get_output() == [
+        "[1, 4, 9, 16, 16]", "[9, 1, 4, 9, 16]", "16 5 false true", "[-1, -1, -1, -1, -1]", "[7, 7]"]
+    for call, error_type in (
+        ("get(a, 3)", ErrorType.FAULT_ERROR),
+        ("set(a, -1, 0)", ErrorType.FAULT_ERROR),
+        ('set(a, 0, "x")', ErrorType.TYPE_ERROR),
+        ("set(a, 0, 9223372036854775807 + 1)", ErrorType.FAULT_ERROR),
+        ("copy(a, 2, a, 0, 2)", ErrorType.FAULT_ERROR),
+        ("get(nil, 0)", ErrorType.FAULT_ERROR),
+    ):
+        assert error_of(f"func main() {{ var a; a = array(3); {call}; }}").error_type == error_type
+
+
+def test_arrays_are_charged_once_per_instance():
+    program = "func main() { var a; var b; var c; a = array(10000); b = a; c = a; print(size(c)); }"
+    interpreter = run(program, memory_limit=100000)
+    assert interpreter.get_output() == ["10000"] and interpreter.get_peak_memory() < 100000
+    program = "func main() { var a; var i; for (i = 0; i < 100; i = i + 1) { a = array(10000); } }"
+    assert run(program, memory_limit=200000).get_peak_memory() < 200000
+    program = "func main() { var a; var b; a = array(10000); b = copy(a); }"
+    assert error_of(program, memory_limit=100000).error_type == ErrorType.MEMORY_LIMIT_ERROR
+
+
+# maps
+
+def test_map_put_get_and_delete():
+    program = """func main() {
+  var m;
+  m = map();
+  put(m, "k", 1); put(m, true, 2); put(m, 1, 3); put(m, "k", 4); put(m, substring(repeat("k", 100), 0, 1), 5);
+  print(get(m, "k"), " ", get(m, true), " ", get(m, 1), " ", size(m));
+  print(delete(m, 1), " ", delete(m, 1), " ", has(m, 1), " ", get(m, 1), " ", has(m, "k"));
+  print(m);
+}"""
+    assert run(program).get_output() == ["5 2 3 3", "true false false nil true", "{k: 5, true: 2}"]
+    assert error_of("func main() { var m; m = map(); put(m, nil, 1); }").error_type == ErrorType.TYPE_ERROR
+    assert error_of("func main() { var m: map; put(m, 1, 1); }").error_type == ErrorType.FAULT_ERROR
+
+
+def test_map_entries_count_against_the_quota():
+    program = "func main() { var m: map; var i; m = map(); for (i = 0; i < 200; i = i + 1) { put(m, i, array(10000)); } }"
+    assert error_of(program, memory_limit=100000).error_type == ErrorType.MEMORY_LIMIT_ERROR
+
+
+# printing
+
+def test_print_formats_each_type():
+    program = """struct point { x: int; }
+func main() {
+  var i; var p: point;
+  print(true); print(false); print(nil); print(-3); print(p);
+  p = new point;
+  print(p, " ", 1 == 1, " ", nil, " ", "s", " ", -0, " ", array(1));
+  for (i = 0; i < 2; i = i + 1) { print("literal ", 1, true, nil); }
+}"""
+    assert run(program).get_output() == [
+        "true", "false", "nil", "-3", "nil", "point true nil s 0 [0]", "literal 1truenil", "literal 1truenil"]
+
+
+# output sinks
+
+def test_memory_log_sink_caps_utf8_bytes():
+    sink = MemoryLogSink(max_bytes=10)
+    for line in ("ab", "ééé", "x"):
+        sink.write(line)
+    assert sink.lines() == ["ab", "ééé"] and sink.dropped == 1
+    sink = MemoryLogSink(max_lines=1, spill=True)
+    for line in ("a", "b\\nc", "d\ne"):
+        sink.write(line)
+    assert sink.lines() == ["a", "b\\nc", "d\ne"]
+
+
+def test_file_descriptor_sink_writes_every_line():
+    read_end, write_end = os.pipe()
+    sink = FileDescriptorSink(write_end, flush_size=4)
+    for line in ("one", "twö", "three"):
+        sink.write(line)
+    sink.flush()
+    os.close(write_end)
+    with os.fdopen(read_end, "rb") as pipe:
+        assert pipe.read().decode() == "one\ntwö\nthree\n"
+
+
+# input providers
+
+SUM = "func main() { print(inputi() + inputi()); }"
+
+
+def test_stream_input_lines_and_tokens():
+    for chunk_size in (1, 3, 1 << 20):
+        provider = StreamInput(io.BytesIO(b"12\n-3\r\nword\n7"), chunk_size)
+        assert [provider.read_int(), provider.read_int(), provider.read(), provider.read_int(), provider.read()] == \
+            [12, -3, "word", 7, None]
+        provider = StreamInput(io.BytesIO(b" 1 2\n\n3  "), chunk_size, tokens=True)
+        assert [provider.read_int() for _ in range(4)] == [1, 2, 3, None]
+
+
+def test_input_cursor_matches_list_input():
+    listed = Interpreter(console_output=False, inp=["4", "x"])
+    provided = Interpreter(console_output=False, input_provider=IteratorInput(["4", "x"]))
+    for interpreter in (listed, provided):
+        with pytest.raises(BrewinError):
+            interpreter.run(SUM)
+        assert interpreter.input_cursor == 2
+
+
+def test_pipe_input_survives_reset():
+    read_end, write_end = os.pipe()
+    os.write(write_end, b"1\n2\n3\n4")
+    os.close(write_end)
+    with os.fdopen(read_end, "rb") as pipe:
+        interpreter = Interpreter(console_output=False, input_provider=StreamInput(pipe))
+        interpreter.run("func main() { print(inputi()); }")
+        interpreter.reset()
+        interpreter.run(SUM)
+    assert interpreter.get_output() == ["5"] and interpreter.input_cursor == 2
+
+
+def test_iterator_input_none_is_a_value():
+    provider = IteratorInput([1, "2", None, 4])
+    assert [provider.read_int(), provider.read_int()] == [1, 2]
+    with pytest.raises(ValueError):
+        provider.read_int()
+    assert [provider.read_int(), provider.read_int()] == [4, None]
+
+
+def test_mmap_input_rewinds(tmp_path):
+    path = tmp_path / "input.txt"
+    path.write_bytes(b"20\n22\n")
+    provider = MmapInput(str(path))
+    interpreter = Interpreter(console_output=False, input_provider=provider)
+    interpreter.run(SUM)
+    interpreter.reset()
+    interpreter.run(SUM)
+    provider.close()
+    assert interpreter.get_output() == ["42"]